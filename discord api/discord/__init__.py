@@ -35,7 +35,7 @@ from .colour import Color, Colour
 from .invite import Invite
 from .object import Object
 from .reaction import Reaction
-from . import utils, opus, abc
+from . import utils, opus, abc, tracing, codec, etf
 from .enums import *
 from collections import namedtuple
 from .embeds import Embed
@@ -783,6 +783,38 @@ class Messageable(metaclass=abc.ABCMeta):
             asyncio.ensure_future(delete(), loop=state.loop)
         return ret
 
+    async def send_encoded(self, body):
+        """|coro|
+
+        Sends a message from a request body that is already JSON encoded.
+
+        This skips building and encoding the payload, so a reply that is
+        sent often can be encoded once with :func:`utils.to_json` and the
+        same ``bytes`` or ``str`` reused for every send.
+
+        Parameters
+        ------------
+        body: Union[bytes, str]
+            The JSON body of the request, e.g. ``{"content":"Hello"}``.
+
+        Raises
+        --------
+        HTTPException
+            Sending the message failed.
+        Forbidden
+            You do not have the proper permissions to send the message.
+
+        Returns
+        ---------
+        :class:`Message`
+            The message that was sent.
+        """
+
+        channel = await self._get_channel()
+        state = self._state
+        data = await state.http.send_message_body(channel.id, body)
+        return state.create_message(channel=channel, data=data)
+
     async def trigger_typing(self):
         """|coro|
 
@@ -105,6 +105,23 @@ class Client:
         WebSocket in the case of not receiving a HEARTBEAT_ACK. Useful if
         processing the initial packets take too long to the point of disconnecting
         you. The default timeout is 60 seconds.
+    json_codec: Optional[Union[:class:`str`, object]]
+        The JSON codec used for gateway frames and HTTP bodies, either
+        ``'json'`` (the default), ``'orjson'`` or an object with ``loads``,
+        ``dumps`` and ``encode`` methods. See :func:`codec.get_codec`.
+    gateway_encoding: :class:`str`
+        The encoding to request from the gateway, ``'json'`` (the default)
+        or ``'etf'``. ETF frames are decoded by :mod:`etf`, which keeps
+        snowflakes as integers; HTTP still uses the JSON codec. The ETF
+        decoder is slower than JSON, so only use it if you need ETF.
+    selective_events: :class:`bool`
+        Whether parsers may skip building the objects of events that
+        nothing consumes (see :meth:`consumes`). The cache is updated
+        either way. Defaults to ``True``.
+    subscriptions: Optional[Iterable[:class:`str`]]
+        Event names (without ``on_``) to treat as consumed, instead of
+        deriving them from the ``on_*`` handlers. Events awaited with
+        :meth:`wait_for` are always consumed.
 
     Attributes
     -----------
@@ -123,14 +140,20 @@ class Client:
         connector = options.pop('connector', None)
         proxy = options.pop('proxy', None)
         proxy_auth = options.pop('proxy_auth', None)
-        self.http = HTTPClient(connector, proxy=proxy, proxy_auth=proxy_auth, loop=self.loop)
+        json_codec = options.pop('json_codec', None)
+        self.http = HTTPClient(connector, proxy=proxy, proxy_auth=proxy_auth, loop=self.loop, codec=json_codec)
 
         self._handlers = {
             'ready': self._handle_ready
         }
 
+        self.selective_events = options.pop('selective_events', True)
+        subscriptions = options.pop('subscriptions', None)
+        self.subscriptions = frozenset(subscriptions) if subscriptions is not None else None
+
         self._connection = ConnectionState(dispatch=self.dispatch, chunker=self._chunker, handlers=self._handlers,
-                                           syncer=self._syncer, http=self.http, loop=self.loop, **options)
+                                           syncer=self._syncer, http=self.http, loop=self.loop,
+                                           consumes=self.consumes, **options)
 
         self._connection.shard_count = self.shard_count
         self._closed = asyncio.Event(loop=self.loop)
@@ -272,6 +295,24 @@ class Client:
         else:
             asyncio.ensure_future(self._run_event(coro, method, *args, **kwargs), loop=self.loop)
 
+    def consumes(self, event):
+        """Returns whether dispatching ``event`` would reach anything.
+
+        An event is consumed when a :meth:`wait_for` is waiting on it, or
+        when it is in :attr:`subscriptions` if that is set, or otherwise
+        when the client has an ``on_<event>`` handler.
+
+        Parameters
+        -----------
+        event: str
+            The event name, without the ``on_`` prefix.
+        """
+        if not self.selective_events or event in self._listeners:
+            return True
+        if self.subscriptions is not None:
+            return event in self.subscriptions
+        return hasattr(self, 'on_' + event)
+
     async def on_error(self, event_method, *args, **kwargs):
         """|coro|
 
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2015-2017 Rapptz
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import sys
+
+from .errors import InvalidArgument
+
+__all__ = ['JSONCodec', 'OrjsonCodec', 'get_codec']
+
+class JSONCodec:
+    """The default codec, built on the standard library :mod:`json` module.
+
+    Every codec has three methods:
+
+    ``loads(data)``
+        Parses a document from :class:`str` or UTF-8 :class:`bytes`.
+    ``dumps(obj)``
+        Serializes to :class:`str`, for gateway text frames.
+    ``encode(obj)``
+        Serializes to a HTTP request body, :class:`str` or :class:`bytes`.
+    """
+
+    name = 'json'
+
+    def loads(self, data):
+        if sys.version_info < (3, 6) and not isinstance(data, str):
+            data = bytes(data).decode('utf-8')
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=True)
+
+    encode = dumps
+
+class OrjsonCodec:
+    """A codec using the `orjson <https://github.com/ijl/orjson>`_ library.
+
+    It parses bytes directly and serializes straight to UTF-8 bytes, so
+    request bodies skip the intermediate :class:`str`.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.loads = orjson.loads
+        self.encode = orjson.dumps
+
+    def dumps(self, obj):
+        return self.encode(obj).decode('utf-8')
+
+_codecs = {
+    'json': JSONCodec,
+    'orjson': OrjsonCodec,
+}
+
+default = JSONCodec()
+
+def get_codec(codec=None):
+    """Resolves ``codec`` to a codec instance.
+
+    ``codec`` can be ``None`` for the default codec, one of the names
+    ``'json'`` or ``'orjson'``, or an object with ``loads``, ``dumps``
+    and ``encode`` methods.
+    """
+    if codec is None:
+        return default
+    if isinstance(codec, str):
+        try:
+            cls = _codecs[codec]
+        except KeyError:
+            raise InvalidArgument('unknown JSON codec %r, expected one of %s' % (codec, ', '.join(_codecs))) from None
+        return default if cls is JSONCodec else cls()
+    for attr in ('loads', 'dumps', 'encode'):
+        if not callable(getattr(codec, attr, None)):
+            raise InvalidArgument('JSON codec must have a %s method' % attr)
+    return codec
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2015-2017 Rapptz
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import struct
+import zlib
+
+__all__ = ['loads', 'dumps', 'ETFCodec', 'ETFDecodeError']
+
+FORMAT_VERSION = 131
+
+NEW_FLOAT_EXT = 70
+COMPRESSED = 80
+SMALL_INTEGER_EXT = 97
+INTEGER_EXT = 98
+FLOAT_EXT = 99
+ATOM_EXT = 100
+SMALL_TUPLE_EXT = 104
+LARGE_TUPLE_EXT = 105
+NIL_EXT = 106
+STRING_EXT = 107
+LIST_EXT = 108
+BINARY_EXT = 109
+SMALL_BIG_EXT = 110
+LARGE_BIG_EXT = 111
+SMALL_ATOM_EXT = 115
+MAP_EXT = 116
+ATOM_UTF8_EXT = 118
+SMALL_ATOM_UTF8_EXT = 119
+
+_ATOMS = {'nil': None, 'true': True, 'false': False}
+
+_unpack_u16 = struct.Struct('>H').unpack_from
+_unpack_u32 = struct.Struct('>I').unpack_from
+_unpack_i32 = struct.Struct('>i').unpack_from
+_unpack_double = struct.Struct('>d').unpack_from
+_pack_i32 = struct.Struct('>Bi').pack
+_pack_u32 = struct.Struct('>BI').pack
+_pack_double = struct.Struct('>Bd').pack
+
+class ETFDecodeError(ValueError):
+    """Raised when a payload is not a valid external term."""
+    pass
+
+def _decode(data, pos):
+    """Decodes the term at ``pos`` and returns it with the offset after it.
+
+    Binaries and atoms become :class:`str` (``nil``, ``true`` and ``false``
+    become ``None``, ``True`` and ``False``), maps become :class:`dict`,
+    lists and tuples become :class:`list`. Integers, snowflakes included,
+    stay :class:`int`. The common tags are tested first and map keys are
+    read inline, as this runs for every value of every frame.
+    """
+    tag = data[pos]
+    if tag == BINARY_EXT:
+        size, = _unpack_u32(data, pos + 1)
+        pos += 5
+        end = pos + size
+        return str(data[pos:end], 'utf-8'), end
+    if tag == MAP_EXT:
+        arity, = _unpack_u32(data, pos + 1)
+        pos += 5
+        result = {}
+        for _ in range(arity):
+            tag = data[pos]
+            if tag == SMALL_ATOM_UTF8_EXT or tag == SMALL_ATOM_EXT:
+                end = pos + 2 + data[pos + 1]
+                key = str(data[pos + 2:end], 'utf-8')
+                pos = end
+            elif tag == BINARY_EXT:
+                size, = _unpack_u32(data, pos + 1)
+                end = pos + 5 + size
+                key = str(data[pos + 5:end], 'utf-8')
+                pos = end
+            else:
+                key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos
+    if tag == SMALL_INTEGER_EXT:
+        return data[pos + 1], pos + 2
+    if tag == SMALL_ATOM_UTF8_EXT or tag == SMALL_ATOM_EXT:
+        end = pos + 2 + data[pos + 1]
+        name = str(data[pos + 2:end], 'utf-8')
+        return _ATOMS.get(name, name), end
+    if tag == SMALL_BIG_EXT:
+        start = pos + 3
+        end = start + data[pos + 1]
+        value = int.from_bytes(data[start:end], 'little')
+        return (-value if data[pos + 2] else value), end
+    if tag == LIST_EXT:
+        length, = _unpack_u32(data, pos + 1)
+        pos += 5
+        result = []
+        append = result.append
+        for _ in range(length):
+            value, pos = _decode(data, pos)
+            append(value)
+        if data[pos] != NIL_EXT:
+            raise ETFDecodeError('improper lists are not supported')
+        return result, pos + 1
+    if tag == NIL_EXT:
+        return [], pos + 1
+    if tag == INTEGER_EXT:
+        return _unpack_i32(data, pos + 1)[0], pos + 5
+    if tag == NEW_FLOAT_EXT:
+        return _unpack_double(data, pos + 1)[0], pos + 9
+    if tag == ATOM_EXT or tag == ATOM_UTF8_EXT:
+        size, = _unpack_u16(data, pos + 1)
+        end = pos + 3 + size
+        name = str(data[pos + 3:end], 'utf-8')
+        return _ATOMS.get(name, name), end
+    if tag == LARGE_BIG_EXT:
+        size, = _unpack_u32(data, pos + 1)
+        start = pos + 6
+        end = start + size
+        value = int.from_bytes(data[start:end], 'little')
+        return (-value if data[pos + 5] else value), end
+    if tag == STRING_EXT:
+        # a list of small integers
+        length, = _unpack_u16(data, pos + 1)
+        end = pos + 3 + length
+        return list(data[pos + 3:end]), end
+    if tag == SMALL_TUPLE_EXT or tag == LARGE_TUPLE_EXT:
+        if tag == SMALL_TUPLE_EXT:
+            arity, pos = data[pos + 1], pos + 2
+        else:
+            arity, = _unpack_u32(data, pos + 1)
+            pos += 5
+        result = []
+        for _ in range(arity):
+            value, pos = _decode(data, pos)
+            result.append(value)
+        return result, pos
+    if tag == FLOAT_EXT:
+        end = pos + 32
+        return float(bytes(data[pos + 1:end]).rstrip(b'\x00')), end
+    raise ETFDecodeError('unsupported term tag %d at offset %d' % (tag, pos))
+
+def loads(data):
+    """Decodes an external term format payload from :class:`bytes`."""
+    if not data or data[0] != FORMAT_VERSION:
+        raise ETFDecodeError('missing the external term format version byte')
+    try:
+        if data[1] == COMPRESSED:
+            size, = _unpack_u32(data, 2)
+            data = zlib.decompress(data[6:])
+            if len(data) != size:
+                raise ETFDecodeError('compressed term has the wrong size')
+            result, end = _decode(data, 0)
+        else:
+            result, end = _decode(data, 1)
+    except (IndexError, struct.error, UnicodeDecodeError, zlib.error) as e:
+        raise ETFDecodeError('truncated or corrupt term: %s' % e) from e
+    except RecursionError:
+        raise ETFDecodeError('term is nested too deeply') from None
+    if end != len(data):
+        # slices past the end come back short instead of raising
+        raise ETFDecodeError('term is %d bytes long, the payload %d' % (end, len(data)))
+    return result
+
+def _encode(obj, out):
+    # bool and None are checked before int, as bool is an int subclass
+    if obj is None:
+        out += b'\x77\x03nil'
+    elif obj is True:
+        out += b'\x77\x04true'
+    elif obj is False:
+        out += b'\x77\x05false'
+    elif isinstance(obj, str):
+        raw = obj.encode('utf-8')
+        out += _pack_u32(BINARY_EXT, len(raw))
+        out += raw
+    elif isinstance(obj, int):
+        if 0 <= obj < 256:
+            out.append(SMALL_INTEGER_EXT)
+            out.append(obj)
+        elif -2 ** 31 <= obj < 2 ** 31:
+            out += _pack_i32(INTEGER_EXT, obj)
+        else:
+            magnitude = abs(obj)
+            raw = magnitude.to_bytes((magnitude.bit_length() + 7) // 8, 'little')
+            if len(raw) > 255:
+                out += _pack_u32(LARGE_BIG_EXT, len(raw))
+            else:
+                out.append(SMALL_BIG_EXT)
+                out.append(len(raw))
+            out.append(1 if obj < 0 else 0)
+            out += raw
+    elif isinstance(obj, dict):
+        out += _pack_u32(MAP_EXT, len(obj))
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    elif isinstance(obj, (list, tuple)):
+        if obj:
+            out += _pack_u32(LIST_EXT, len(obj))
+            for value in obj:
+                _encode(value, out)
+        out.append(NIL_EXT)
+    elif isinstance(obj, float):
+        out += _pack_double(NEW_FLOAT_EXT, obj)
+    elif isinstance(obj, (bytes, bytearray)):
+        out += _pack_u32(BINARY_EXT, len(obj))
+        out += obj
+    else:
+        raise TypeError('cannot encode %r as an external term' % type(obj).__name__)
+
+def dumps(obj):
+    """Encodes ``obj`` in the external term format and returns :class:`bytes`.
+
+    Strings become binaries and ``None``, ``True`` and ``False`` become
+    the ``nil``, ``true`` and ``false`` atoms, which is what the gateway
+    expects.
+    """
+    out = bytearray((FORMAT_VERSION,))
+    _encode(obj, out)
+    return bytes(out)
+
+class ETFCodec:
+    """Codec for gateway connections opened with ``encoding=etf``.
+
+    :meth:`dumps` returns :class:`bytes`, so payloads go out as binary
+    websocket frames, as the gateway requires for this encoding.
+
+    The decoder is pure Python and several times slower than the JSON
+    codecs on CPython, so this is not a way to speed up decoding. The C
+    decoder in ``erlpack`` is barely faster, returns wrong results for
+    truncated payloads and crashes on deeply nested ones, so it is not
+    used.
+    """
+
+    name = 'etf'
+
+    loads = staticmethod(loads)
+    dumps = staticmethod(dumps)
+    encode = staticmethod(dumps)
+
+codec = ETFCodec()
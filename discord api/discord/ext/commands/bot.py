@@ -191,6 +191,9 @@ class BotBase(GroupMixin):
             coro = self._run_event(event, event_name, *args, **kwargs)
             asyncio.ensure_future(coro, loop=self.loop)
 
+    def consumes(self, event):
+        return super().consumes(event) or bool(self.extra_events.get('on_' + event))
+
     async def close(self):
         for extension in tuple(self.extensions):
             try:
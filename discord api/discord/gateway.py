@@ -29,11 +29,13 @@ import time
 import websockets
 import asyncio
 
-from . import utils
 from .activity import _ActivityTag
+from .codec import default as _default_codec
+from . import etf
 from .errors import ConnectionClosed, InvalidArgument
+from .tracing import tracer
 import logging
-import zlib, json
+import zlib
 from collections import namedtuple
 import threading
 import struct
@@ -41,7 +43,84 @@ import struct
 log = logging.getLogger(__name__)
 
 __all__ = ['DiscordWebSocket', 'KeepAliveHandler', 'VoiceKeepAliveHandler',
-           'DiscordVoiceWebSocket', 'ResumeWebSocket']
+           'DiscordVoiceWebSocket', 'ResumeWebSocket', 'ZlibStreamAssembler',
+           'FrameCounters']
+
+ZLIB_SUFFIX = b'\x00\x00\xff\xff'
+
+class FrameCounters:
+    """Byte and frame counters for one shard's zlib-stream, kept across reconnects."""
+
+    __slots__ = ('messages', 'frames', 'buffered_frames', 'bytes_in', 'bytes_decompressed')
+
+    def __init__(self):
+        self.messages = 0
+        self.frames = 0
+        self.buffered_frames = 0
+        self.bytes_in = 0
+        self.bytes_decompressed = 0
+
+    def to_dict(self):
+        result = {name: getattr(self, name) for name in self.__slots__}
+        result['ratio'] = self.bytes_decompressed / self.bytes_in if self.bytes_in else 0.0
+        return result
+
+class ZlibStreamAssembler:
+    """Joins zlib-stream websocket messages into inflated gateway frames.
+
+    A frame usually arrives as one message ending in the zlib flush
+    suffix and is inflated straight from that message. Frames split over
+    several messages are gathered in a preallocated buffer that is reused
+    (and only ever grown) for the life of the connection, and inflated
+    from a :class:`memoryview` of it, so no per-frame buffer is allocated
+    or copied. The inflated :class:`bytes` go to the decoder as they are.
+    """
+
+    def __init__(self, size=64 * 1024, counters=None):
+        self._zlib = zlib.decompressobj()
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self.counters = counters or FrameCounters()
+
+    def _grow(self, needed):
+        size = max(len(self._buffer) * 2, needed)
+        buffer = bytearray(size)
+        buffer[:self._length] = self._view[:self._length]
+        self._view.release()
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+
+    def feed(self, data):
+        """Adds one websocket message and returns the inflated frame it completes, if any."""
+        counters = self.counters
+        counters.messages += 1
+        counters.bytes_in += len(data)
+
+        if not self._length and data[-4:] == ZLIB_SUFFIX:
+            frame = self._zlib.decompress(data)
+        else:
+            end = self._length + len(data)
+            if end > len(self._buffer):
+                self._grow(end)
+            self._view[self._length:end] = data
+            self._length = end
+            if end < 4 or self._view[end - 4:end] != ZLIB_SUFFIX:
+                return None
+            frame = self._zlib.decompress(self._view[:end])
+            self._length = 0
+            counters.buffered_frames += 1
+
+        counters.frames += 1
+        counters.bytes_decompressed += len(frame)
+        return frame
+
+def _gateway_codec(client):
+    # frames are decoded with the client's JSON codec unless the
+    # gateway was asked for the external term format
+    if client._connection.gateway_encoding == 'etf':
+        return etf.codec
+    return client.http.codec
 
 class ResumeWebSocket(Exception):
     """Signals to initialise via RESUME opcode instead of IDENTIFY."""
@@ -176,21 +255,23 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
     HEARTBEAT_ACK      = 11
     GUILD_SYNC         = 12
 
+    # replaced by the client's codec, or ETF, in from_client
+    codec = _default_codec
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.max_size = None
         # an empty dispatcher to prevent crashes
         self._dispatch = lambda *args: None
-        # generic event listeners
-        self._dispatch_listeners = []
+        # generic event listeners, by event name
+        self._dispatch_listeners = {}
         # the keep alive
         self._keep_alive = None
 
         # ws related stuff
         self.session_id = None
         self.sequence = None
-        self._zlib = zlib.decompressobj()
-        self._buffer = bytearray()
+        self._assembler = ZlibStreamAssembler()
 
     @classmethod
     async def from_client(cls, client, *, shard_id=None, session=None, sequence=None, resume=False):
@@ -198,15 +279,17 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
 
         This is for internal use only.
         """
-        gateway = await client.http.get_gateway()
+        gateway = await client.http.get_gateway(encoding=client._connection.gateway_encoding)
         ws = await websockets.connect(gateway, loop=client.loop, klass=cls, compression=None)
 
         # dynamically add attributes needed
         ws.token = client.http.token
         ws._connection = client._connection
         ws._dispatch = client.dispatch
+        ws.codec = _gateway_codec(client)
         ws.gateway = gateway
         ws.shard_id = shard_id
+        ws._assembler.counters = client._connection.frame_counters(shard_id)
         ws.shard_count = client._connection.shard_count
         ws.session_id = session
         ws.sequence = sequence
@@ -255,7 +338,7 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
 
         future = self.loop.create_future()
         entry = EventListener(event=event, predicate=predicate, result=result, future=future)
-        self._dispatch_listeners.append(entry)
+        self._dispatch_listeners.setdefault(event, []).append(entry)
         return future
 
     async def identify(self):
@@ -310,22 +393,17 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
         log.info('Shard ID %s has sent the RESUME payload.', self.shard_id)
 
     async def received_message(self, msg):
+        start = time.perf_counter() if tracer.enabled else None
         self._dispatch('socket_raw_receive', msg)
 
         if type(msg) is bytes:
-            self._buffer.extend(msg)
-
-            if len(msg) >= 4:
-                if msg[-4:] == b'\x00\x00\xff\xff':
-                    msg = self._zlib.decompress(self._buffer)
-                    msg = msg.decode('utf-8')
-                    self._buffer = bytearray()
-                else:
-                    return
-            else:
+            msg = self._assembler.feed(msg)
+            if msg is None:
                 return
 
-        msg = json.loads(msg)
+        msg = self.codec.loads(msg)
+        if start is not None:
+            tracer.record('gateway.decode', time.perf_counter() - start)
 
         log.debug('For Shard ID %s: WebSocket Event: %s', self.shard_id, msg)
         self._dispatch('socket_response', msg)
@@ -391,39 +469,45 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
             log.info('Shard ID %s has successfully RESUMED session %s under trace %s.',
                      self.shard_id, self.session_id, ', '.join(trace))
 
-        parser = 'parse_' + event.lower()
+        if start is not None and event == 'MESSAGE_CREATE':
+            tracer.mark(int(data['id']), start)
 
-        try:
-            func = getattr(self._connection, parser)
-        except AttributeError:
+        elapsed = self._connection.parse(event, data)
+        if elapsed is None:
             log.warning('Unknown event %s.', event)
-        else:
-            func(data)
-
-        # remove the dispatched listeners
-        removed = []
-        for index, entry in enumerate(self._dispatch_listeners):
-            if entry.event != event:
-                continue
-
+        elif start is not None:
+            tracer.record('gateway.parse.' + event, elapsed)
+
+        # most events have nobody waiting on them
+        listeners = self._dispatch_listeners.get(event)
+        if listeners:
+            self._process_listeners(event, listeners, data)
+
+    def _process_listeners(self, event, listeners, data):
+        remaining = []
+        count = len(listeners)
+        for entry in listeners[:count]:
             future = entry.future
             if future.cancelled():
-                removed.append(index)
                 continue
 
             try:
                 valid = entry.predicate(data)
             except Exception as e:
                 future.set_exception(e)
-                removed.append(index)
             else:
                 if valid:
                     ret = data if entry.result is None else entry.result(data)
                     future.set_result(ret)
-                    removed.append(index)
+                else:
+                    remaining.append(entry)
 
-        for index in reversed(removed):
-            del self._dispatch_listeners[index]
+        # keep listeners that a predicate registered while we were iterating
+        remaining.extend(listeners[count:])
+        if remaining:
+            self._dispatch_listeners[event] = remaining
+        else:
+            self._dispatch_listeners.pop(event, None)
 
     @property
     def latency(self):
@@ -459,7 +543,7 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
 
     async def send_as_json(self, data):
         try:
-            await self.send(utils.to_json(data))
+            await self.send(self.codec.dumps(data))
         except websockets.exceptions.ConnectionClosed as e:
             if not self._can_handle_close(e.code):
                 raise ConnectionClosed(e, shard_id=self.shard_id) from e
@@ -483,7 +567,7 @@ class DiscordWebSocket(websockets.client.WebSocketClientProtocol):
             }
         }
 
-        sent = utils.to_json(payload)
+        sent = self.codec.dumps(payload)
         log.debug('Sending "%s" to change status', sent)
         await self.send(sent)
 
@@ -552,6 +636,8 @@ class DiscordVoiceWebSocket(websockets.client.WebSocketClientProtocol):
     HELLO               = 8
     INVALIDATE_SESSION  = 9
 
+    codec = _default_codec
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.max_size = None
@@ -559,7 +645,7 @@ class DiscordVoiceWebSocket(websockets.client.WebSocketClientProtocol):
 
     async def send_as_json(self, data):
         log.debug('Sending voice websocket frame: %s.', data)
-        await self.send(utils.to_json(data))
+        await self.send(self.codec.dumps(data))
 
     async def resume(self):
         state = self._connection
@@ -593,6 +679,7 @@ class DiscordVoiceWebSocket(websockets.client.WebSocketClientProtocol):
         ws = await websockets.connect(gateway, loop=client.loop, klass=cls, compression=None)
         ws.gateway = gateway
         ws._connection = client
+        ws.codec = client._state.http.codec
         ws._max_heartbeat_timeout = 60.0
 
         if resume:
@@ -678,7 +765,7 @@ class DiscordVoiceWebSocket(websockets.client.WebSocketClientProtocol):
     async def poll_event(self):
         try:
             msg = await asyncio.wait_for(self.recv(), timeout=30.0, loop=self.loop)
-            await self.received_message(json.loads(msg))
+            await self.received_message(self.codec.loads(msg))
         except websockets.exceptions.ConnectionClosed as e:
             raise ConnectionClosed(e, shard_id=None) from e
 
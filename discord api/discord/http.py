@@ -26,7 +26,6 @@ DEALINGS IN THE SOFTWARE.
 
 import aiohttp
 import asyncio
-import json
 import sys
 import logging
 import weakref
@@ -36,12 +35,15 @@ log = logging.getLogger(__name__)
 
 from .errors import HTTPException, Forbidden, NotFound, LoginFailure, GatewayNotFound
 from . import __version__, utils
+from .codec import default as _default_codec, get_codec
+from .tracing import tracer
 
-async def json_or_text(response):
-    text = await response.text(encoding='utf-8')
+async def json_or_text(response, codec=_default_codec):
+    data = await response.read()
     if response.headers['content-type'] == 'application/json':
-        return json.loads(text)
-    return text
+        # parsed straight from the bytes, no intermediate str
+        return codec.loads(data)
+    return data.decode('utf-8')
 
 class Route:
     BASE = 'https://discordapp.com/api/v7'
@@ -85,7 +87,7 @@ class HTTPClient:
     SUCCESS_LOG = '{method} {url} has received {text}'
     REQUEST_LOG = '{method} {url} with {json} has returned {status}'
 
-    def __init__(self, connector=None, *, proxy=None, proxy_auth=None, loop=None):
+    def __init__(self, connector=None, *, proxy=None, proxy_auth=None, loop=None, codec=None):
         self.loop = asyncio.get_event_loop() if loop is None else loop
         self.connector = connector
         self._session = aiohttp.ClientSession(connector=connector, loop=self.loop)
@@ -96,6 +98,9 @@ class HTTPClient:
         self.bot_token = False
         self.proxy = proxy
         self.proxy_auth = proxy_auth
+        self.codec = get_codec(codec)
+        self.requests_sent = 0
+        self.rate_limited = 0
 
         user_agent = 'DiscordBot (https://github.com/Rapptz/discord.py {0}) Python/{1[0]}.{1[1]} aiohttp/{2}'
         self.user_agent = user_agent.format(__version__, sys.version_info, aiohttp.__version__)
@@ -105,6 +110,12 @@ class HTTPClient:
             self._session = aiohttp.ClientSession(connector=self.connector, loop=self.loop)
 
     async def request(self, route, *, header_bypass_delay=None, **kwargs):
+        if tracer.enabled:
+            with tracer.span('http.' + route.method + ' ' + route.path):
+                return await self._request(route, header_bypass_delay=header_bypass_delay, **kwargs)
+        return await self._request(route, header_bypass_delay=header_bypass_delay, **kwargs)
+
+    async def _request(self, route, *, header_bypass_delay=None, **kwargs):
         bucket = route.bucket
         method = route.method
         url = route.url
@@ -125,7 +136,11 @@ class HTTPClient:
         # some checking if it's a JSON request
         if 'json' in kwargs:
             headers['Content-Type'] = 'application/json'
-            kwargs['data'] = utils.to_json(kwargs.pop('json'))
+            kwargs['data'] = self.codec.encode(kwargs.pop('json'))
+        elif 'json_body' in kwargs:
+            # already encoded by the caller
+            headers['Content-Type'] = 'application/json'
+            kwargs['data'] = kwargs.pop('json_body')
 
         try:
             reason = kwargs.pop('reason')
@@ -150,11 +165,12 @@ class HTTPClient:
         await lock
         with MaybeUnlock(lock) as maybe_lock:
             for tries in range(5):
+                self.requests_sent += 1
                 async with self._session.request(method, url, **kwargs) as r:
                     log.debug('%s %s with %s has returned %s', method, url, kwargs.get('data'), r.status)
 
                     # even errors have text involved in them so this is safe to call
-                    data = await json_or_text(r)
+                    data = await json_or_text(r, self.codec)
 
                     # check if we have rate limit header information
                     remaining = r.headers.get('X-Ratelimit-Remaining')
@@ -176,6 +192,7 @@ class HTTPClient:
 
                     # we are being rate limited
                     if r.status == 429:
+                        self.rate_limited += 1
                         fmt = 'We are being rate limited. Retrying in %.2f seconds. Handled under the bucket "%s"'
 
                         # sleep a bit
@@ -313,6 +330,10 @@ class HTTPClient:
 
         return self.request(r, json=payload)
 
+    def send_message_body(self, channel_id, body):
+        r = Route('POST', '/channels/{channel_id}/messages', channel_id=channel_id)
+        return self.request(r, json_body=body)
+
     def send_typing(self, channel_id):
         return self.request(Route('POST', '/channels/{channel_id}/typing', channel_id=channel_id))
 
@@ -328,7 +349,7 @@ class HTTPClient:
         if nonce:
             payload['nonce'] = nonce
 
-        form.add_field('payload_json', utils.to_json(payload))
+        form.add_field('payload_json', self.codec.dumps(payload))
         if len(files) == 1:
             fp = files[0]
             form.add_field('file', fp[0], filename=fp[1], content_type='application/octet-stream')
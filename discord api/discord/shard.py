@@ -27,6 +27,7 @@ DEALINGS IN THE SOFTWARE.
 from .state import AutoShardedConnectionState
 from .client import Client
 from .gateway import *
+from .gateway import _gateway_codec
 from .errors import ClientException, InvalidArgument
 from . import utils
 from .enums import Status
@@ -125,7 +126,8 @@ class AutoShardedClient(Client):
 
         self._connection = AutoShardedConnectionState(dispatch=self.dispatch, chunker=self._chunker,
                                                       handlers=self._handlers, syncer=self._syncer,
-                                                      http=self.http, loop=self.loop, **kwargs)
+                                                      http=self.http, loop=self.loop, consumes=self.consumes,
+                                                      **kwargs)
 
         # instead of a single websocket, we have multiple
         # the key is the shard_id
@@ -219,8 +221,10 @@ class AutoShardedClient(Client):
         ws.token = self.http.token
         ws._connection = self._connection
         ws._dispatch = self.dispatch
+        ws.codec = _gateway_codec(self)
         ws.gateway = gateway
         ws.shard_id = shard_id
+        ws._assembler.counters = self._connection.frame_counters(shard_id)
         ws.shard_count = self.shard_count
         ws._max_heartbeat_timeout = self._connection.heartbeat_timeout
 
@@ -239,10 +243,11 @@ class AutoShardedClient(Client):
         await asyncio.sleep(5.0, loop=self.loop)
 
     async def launch_shards(self):
+        encoding = self._connection.gateway_encoding
         if self.shard_count is None:
-            self.shard_count, gateway = await self.http.get_bot_gateway()
+            self.shard_count, gateway = await self.http.get_bot_gateway(encoding=encoding)
         else:
-            gateway = await self.http.get_gateway()
+            gateway = await self.http.get_gateway(encoding=encoding)
 
         self._connection.shard_count = self.shard_count
 
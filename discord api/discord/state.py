@@ -37,6 +37,8 @@ from .role import Role
 from .enums import ChannelType, try_enum, Status
 from . import utils
 from .embeds import Embed
+from .gateway import FrameCounters
+from .errors import InvalidArgument
 
 from collections import deque, namedtuple, OrderedDict
 import copy, enum, math
@@ -45,6 +47,7 @@ import asyncio
 import logging
 import weakref
 import itertools
+import time
 
 class ListenerType(enum.Enum):
     chunk = 0
@@ -54,11 +57,13 @@ log = logging.getLogger(__name__)
 ReadyState = namedtuple('ReadyState', ('launch', 'guilds'))
 
 class ConnectionState:
-    def __init__(self, *, dispatch, chunker, handlers, syncer, http, loop, **options):
+    def __init__(self, *, dispatch, chunker, handlers, syncer, http, loop, consumes=None, **options):
         self.loop = loop
         self.http = http
         self.max_messages = max(options.get('max_messages', 5000), 100)
         self.dispatch = dispatch
+        # tells whether a dispatched event reaches anything, see Client.consumes
+        self._consumes = consumes
         self.chunker = chunker
         self.syncer = syncer
         self.is_bot = None
@@ -67,7 +72,14 @@ class ConnectionState:
         self._ready_task = None
         self._fetch_offline = options.get('fetch_offline_members', True)
         self.heartbeat_timeout = options.get('heartbeat_timeout', 60.0)
+        self.gateway_encoding = options.get('gateway_encoding', 'json')
+        if self.gateway_encoding not in ('json', 'etf'):
+            raise InvalidArgument('gateway_encoding must be json or etf.')
+        self._frame_counters = {}
         self._listeners = []
+        # event name -> [count, seconds spent parsing]
+        self._event_stats = {}
+        self.parsers = {event: func.__get__(self) for event, func in self._parser_table().items()}
 
         activity = options.get('activity', None)
         if activity:
@@ -88,6 +100,70 @@ class ConnectionState:
 
         self.clear()
 
+    def frame_counters(self, shard_id):
+        """Returns the :class:`gateway.FrameCounters` of a shard (``None`` when not sharded)."""
+        try:
+            return self._frame_counters[shard_id]
+        except KeyError:
+            counters = self._frame_counters[shard_id] = FrameCounters()
+            return counters
+
+    def gateway_stats(self):
+        """Returns the zlib-stream counters of every shard as dicts."""
+        return {shard_id: counters.to_dict() for shard_id, counters in self._frame_counters.items()}
+
+    @classmethod
+    def _parser_table(cls):
+        """Maps raw gateway event names to the ``parse_*`` functions of ``cls``.
+
+        Built once per class, so subclasses get their own overrides.
+        """
+        table = cls.__dict__.get('_parsers')
+        if table is None:
+            table = {name[6:].upper(): getattr(cls, name) for name in dir(cls) if name.startswith('parse_')}
+            cls._parsers = table
+        return table
+
+    def parse(self, event, data):
+        """Runs the parser of a raw gateway event.
+
+        Returns the seconds it took, or ``None`` for events without a parser.
+        """
+        func = self.parsers.get(event)
+        if func is None:
+            return None
+        start = time.perf_counter()
+        try:
+            func(data)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self._event_stats.get(event)
+            if stats is None:
+                stats = self._event_stats[event] = [0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+        return elapsed
+
+    def consumes(self, *events):
+        """Whether dispatching any of ``events`` would reach a handler or waiter.
+
+        Parsers use this to skip building objects that only the dispatch
+        would use. Cache updates are never skipped.
+        """
+        consumes = self._consumes
+        if consumes is None:
+            return True
+        for event in events:
+            if consumes(event):
+                return True
+        return False
+
+    def event_stats(self):
+        """Returns the count and cumulative parse time of every event type received."""
+        return {event: {'count': count, 'parse_ms': 1000 * seconds,
+                        'mean_us': 1e6 * seconds / count}
+                for event, (count, seconds) in self._event_stats.items()}
+
     def clear(self):
         self.user = None
         self._users = weakref.WeakValueDictionary()
@@ -241,7 +317,8 @@ class ConnectionState:
             self._private_channels_by_user.pop(channel.recipient.id, None)
 
     def _get_message(self, msg_id):
-        return utils.find(lambda m: m.id == msg_id, self._messages)
+        # edits and reactions are mostly about recent messages
+        return utils.find(lambda m: m.id == msg_id, reversed(self._messages))
 
     def _add_guild_from_data(self, guild):
         guild = Guild(data=guild, state=self)
@@ -379,11 +456,13 @@ class ConnectionState:
             self._messages.remove(msg)
 
     def parse_message_update(self, data):
-        raw = RawMessageUpdateEvent(data)
-        self.dispatch('raw_message_edit', raw)
-        message = self._get_message(raw.message_id)
+        if self.consumes('raw_message_edit'):
+            raw = RawMessageUpdateEvent(data)
+            self.dispatch('raw_message_edit', raw)
+        message = self._get_message(int(data['id']))
         if message is not None:
-            older_message = copy.copy(message)
+            dispatch = self.consumes('message_edit')
+            older_message = copy.copy(message) if dispatch else None
             if 'call' in data:
                 # call state message edit
                 message._handle_call(data['call'])
@@ -393,42 +472,56 @@ class ConnectionState:
             else:
                 message._update(channel=message.channel, data=data)
 
-            self.dispatch('message_edit', older_message, message)
+            if dispatch:
+                self.dispatch('message_edit', older_message, message)
 
     def parse_message_reaction_add(self, data):
+        message = self._get_message(int(data['message_id']))
+        dispatch_raw = self.consumes('raw_reaction_add')
+        if message is None and not dispatch_raw:
+            # no cached message to update and nobody to tell
+            return
+
         emoji_data = data['emoji']
         emoji_id = utils._get_as_snowflake(emoji_data, 'id')
         emoji = PartialEmoji(animated=emoji_data['animated'], id=emoji_id, name=emoji_data['name'])
         raw = RawReactionActionEvent(data, emoji)
-        self.dispatch('raw_reaction_add', raw)
+        if dispatch_raw:
+            self.dispatch('raw_reaction_add', raw)
 
         # rich interface here
-        message = self._get_message(raw.message_id)
         if message is not None:
             emoji = self._upgrade_partial_emoji(emoji)
             reaction = message._add_reaction(data, emoji, raw.user_id)
-            user = self._get_reaction_user(message.channel, raw.user_id)
-            if user:
-                self.dispatch('reaction_add', reaction, user)
+            if self.consumes('reaction_add'):
+                user = self._get_reaction_user(message.channel, raw.user_id)
+                if user:
+                    self.dispatch('reaction_add', reaction, user)
 
     def parse_message_reaction_remove_all(self, data):
-        raw = RawReactionClearEvent(data)
-        self.dispatch('raw_reaction_clear', raw)
+        if self.consumes('raw_reaction_clear'):
+            raw = RawReactionClearEvent(data)
+            self.dispatch('raw_reaction_clear', raw)
 
-        message = self._get_message(raw.message_id)
+        message = self._get_message(int(data['message_id']))
         if message is not None:
             old_reactions = message.reactions.copy()
             message.reactions.clear()
             self.dispatch('reaction_clear', message, old_reactions)
 
     def parse_message_reaction_remove(self, data):
+        message = self._get_message(int(data['message_id']))
+        dispatch_raw = self.consumes('raw_reaction_remove')
+        if message is None and not dispatch_raw:
+            return
+
         emoji_data = data['emoji']
         emoji_id = utils._get_as_snowflake(emoji_data, 'id')
         emoji = PartialEmoji(animated=emoji_data['animated'], id=emoji_id, name=emoji_data['name'])
         raw = RawReactionActionEvent(data, emoji)
-        self.dispatch('raw_reaction_remove', raw)
+        if dispatch_raw:
+            self.dispatch('raw_reaction_remove', raw)
 
-        message = self._get_message(raw.message_id)
         if message is not None:
             emoji = self._upgrade_partial_emoji(emoji)
             try:
@@ -436,9 +529,10 @@ class ConnectionState:
             except (AttributeError, ValueError): # eventual consistency lol
                 pass
             else:
-                user = self._get_reaction_user(message.channel, raw.user_id)
-                if user:
-                    self.dispatch('reaction_remove', reaction, user)
+                if self.consumes('reaction_remove'):
+                    user = self._get_reaction_user(message.channel, raw.user_id)
+                    if user:
+                        self.dispatch('reaction_remove', reaction, user)
 
     def parse_presence_update(self, data):
         guild_id = utils._get_as_snowflake(data, 'guild_id')
@@ -459,9 +553,13 @@ class ConnectionState:
             member = Member(guild=guild, data=data, state=self)
             guild._add_member(member)
 
-        old_member = Member._copy(member)
-        member._presence_update(data=data, user=user)
-        self.dispatch('member_update', old_member, member)
+        if self.consumes('member_update'):
+            old_member = Member._copy(member)
+            member._presence_update(data=data, user=user)
+            self.dispatch('member_update', old_member, member)
+        else:
+            # the cached presence is kept current, only the copy is skipped
+            member._presence_update(data=data, user=user)
 
     def parse_user_update(self, data):
         self.user = ClientUser(state=self, data=data)
@@ -599,9 +697,12 @@ class ConnectionState:
 
         member = guild.get_member(user_id)
         if member is not None:
-            old_member = copy.copy(member)
-            member._update(data, user)
-            self.dispatch('member_update', old_member, member)
+            if self.consumes('member_update'):
+                old_member = copy.copy(member)
+                member._update(data, user)
+                self.dispatch('member_update', old_member, member)
+            else:
+                member._update(data, user)
         else:
             log.warning('GUILD_MEMBER_UPDATE referencing an unknown member ID: %s. Discarding.', user_id)
 
@@ -826,6 +927,10 @@ class ConnectionState:
             asyncio.ensure_future(vc._create_socket(key_id, data))
 
     def parse_typing_start(self, data):
+        if not self.consumes('typing'):
+            # typing events only dispatch, they don't touch the cache
+            return
+
         channel, guild = self._get_guild_channel(data)
         if channel is not None:
             member = None
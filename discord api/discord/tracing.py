@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2015-2017 Rapptz
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import atexit
+import collections
+import json
+import math
+import threading
+import time
+
+__all__ = ['Tracer', 'tracer', 'enable', 'disable', 'span', 'dump']
+
+class Histogram:
+    """Latency histogram with logarithmic buckets.
+
+    Every bucket covers a factor of 2 ** (1 / :attr:`RESOLUTION`) in
+    microseconds, so percentiles are accurate to within about 20%
+    regardless of the scale. The exact count, sum, minimum and maximum
+    are kept as well.
+    """
+
+    RESOLUTION = 4
+
+    __slots__ = ('buckets', 'count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.floor(math.log2(micros) * self.RESOLUTION)) if micros >= 1.0 else 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, q):
+        """Returns the upper bound of the bucket holding the ``q``-th percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = 2.0 ** ((index + 1) / self.RESOLUTION) / 1e6
+                return min(upper, self.maximum)
+        return self.maximum
+
+    def to_dict(self):
+        ms = 1000.0
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * ms if self.count else 0.0,
+            'min_ms': (self.minimum or 0.0) * ms,
+            'p50_ms': self.percentile(50) * ms,
+            'p95_ms': self.percentile(95) * ms,
+            'p99_ms': self.percentile(99) * ms,
+            'max_ms': self.maximum * ms,
+        }
+
+class _Span:
+    __slots__ = ('tracer', 'stage', 'start')
+
+    def __init__(self, tracer, stage):
+        self.tracer = tracer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.stage, time.perf_counter() - self.start)
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class Tracer:
+    """Collects per-stage latency histograms for the message pipeline.
+
+    Instrumented code checks :attr:`enabled` before reading the clock, so
+    a disabled tracer costs one attribute lookup per stage.
+
+    The library records these stages:
+
+    ``gateway.decode``
+        Decompressing and decoding a complete gateway frame.
+    ``gateway.parse.<EVENT>``
+        Building models and dispatching for one event, e.g.
+        ``gateway.parse.MESSAGE_CREATE``.
+    ``http.<METHOD> <path>``
+        One :meth:`HTTPClient.request`, including lock and rate limit waits.
+
+    Applications add their own with :meth:`span` or :meth:`record`, and
+    can measure from the frame that carried a message with :meth:`finish`.
+    Both may be called from other threads, e.g. classifier workers.
+    """
+
+    MAX_MARKS = 4096
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.interval = None
+        self.histograms = {}
+        self._marks = collections.OrderedDict()
+        self._last_write = 0.0
+        self._exit_hook = False
+        self._lock = threading.Lock()
+
+    def enable(self, path=None, *, interval=30.0):
+        """Starts recording.
+
+        If ``path`` is given the histograms are written there as JSON
+        every ``interval`` seconds while recording and at exit.
+        """
+        self.enabled = True
+        self.path = path
+        self.interval = interval
+        self._last_write = time.monotonic()
+        if path is not None and not self._exit_hook:
+            atexit.register(self._write_at_exit)
+            self._exit_hook = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.histograms = {}
+        self._marks.clear()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            try:
+                histogram = self.histograms[stage]
+            except KeyError:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(seconds)
+
+        if self.path is not None and time.monotonic() - self._last_write >= self.interval:
+            self.write(self.path)
+
+    def span(self, stage):
+        """Returns a context manager that records the time spent in its block."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, stage)
+
+    def mark(self, key, start):
+        """Remembers that the work for ``key`` (e.g. a message ID) started at ``start``."""
+        marks = self._marks
+        marks[key] = start
+        if len(marks) > self.MAX_MARKS:
+            marks.popitem(last=False)
+
+    def finish(self, stage, key):
+        """Records the time since :meth:`mark` was called for ``key`` under ``stage``."""
+        start = self._marks.pop(key, None)
+        if start is not None:
+            self.record(stage, time.perf_counter() - start)
+
+    def dump(self):
+        """Returns every stage's histogram summary as a :class:`dict`."""
+        with self._lock:
+            return {stage: histogram.to_dict() for stage, histogram in sorted(self.histograms.items())}
+
+    def write(self, path):
+        """Writes :meth:`dump` to ``path`` as JSON."""
+        self._last_write = time.monotonic()
+        with open(path, 'w') as fp:
+            json.dump(self.dump(), fp, indent=2)
+
+    def _write_at_exit(self):
+        if self.enabled and self.path is not None:
+            self.write(self.path)
+
+tracer = Tracer()
+
+def enable(path=None, *, interval=30.0):
+    """Enables the global :data:`tracer`. See :meth:`Tracer.enable`."""
+    tracer.enable(path, interval=interval)
+
+def disable():
+    tracer.disable()
+
+def span(stage):
+    return tracer.span(stage)
+
+def dump():
+    return tracer.dump()
@@ -26,11 +26,11 @@ DEALINGS IN THE SOFTWARE.
 
 import aiohttp
 import asyncio
-import json
 import time
 import re
 
 from . import utils
+from .codec import default as _default_codec, get_codec
 from .errors import InvalidArgument, HTTPException, Forbidden, NotFound
 from .user import BaseUser, User
 
@@ -43,9 +43,12 @@ class WebhookAdapter:
     ------------
     webhook: :class:`Webhook`
         The webhook that owns this adapter.
+    codec
+        The JSON codec for request and response bodies.
     """
 
     BASE = 'https://discordapp.com/api/v7'
+    codec = _default_codec
 
     def _prepare(self, webhook):
         self._webhook_id = webhook.id
@@ -107,7 +110,7 @@ class WebhookAdapter:
         if file is not None:
             multipart = {
                 'file': file,
-                'payload_json': utils.to_json(payload)
+                'payload_json': self.codec.dumps(payload)
             }
             data = None
         else:
@@ -129,18 +132,21 @@ class AsyncWebhookAdapter(WebhookAdapter):
     -----------
     session: aiohttp.ClientSession
         The session to use to send requests.
+    json_codec: Optional[Union[:class:`str`, object]]
+        The JSON codec to use, see :func:`codec.get_codec`.
     """
 
-    def __init__(self, session):
+    def __init__(self, session, *, json_codec=None):
         self.session = session
         self.loop = session.loop
+        self.codec = get_codec(json_codec)
 
     async def request(self, verb, url, payload=None, multipart=None):
         headers = {}
         data = None
         if payload:
             headers['Content-Type'] = 'application/json'
-            data = utils.to_json(payload)
+            data = self.codec.encode(payload)
 
         if multipart:
             file = multipart.pop('file', None)
@@ -152,9 +158,11 @@ class AsyncWebhookAdapter(WebhookAdapter):
 
         for tries in range(5):
             async with self.session.request(verb, url, headers=headers, data=data) as r:
-                data = await r.text(encoding='utf-8')
+                data = await r.read()
                 if r.headers['Content-Type'] == 'application/json':
-                    data = json.loads(data)
+                    data = self.codec.loads(data)
+                else:
+                    data = data.decode('utf-8')
 
                 # check if we have rate limit header information
                 remaining = r.headers.get('X-Ratelimit-Remaining')
@@ -207,33 +215,37 @@ class RequestsWebhookAdapter(WebhookAdapter):
         Whether to sleep the thread when encountering a 429 or pre-emptive
         rate limit or a 5xx status code. Defaults to ``True``. If set to
         ``False`` then this will raise an :exc:`HTTPException` instead.
+    json_codec: Optional[Union[:class:`str`, object]]
+        The JSON codec to use, see :func:`codec.get_codec`.
     """
 
-    def __init__(self, session=None, *, sleep=True):
+    def __init__(self, session=None, *, sleep=True, json_codec=None):
         import requests
         self.session = session or requests
         self.sleep = sleep
+        self.codec = get_codec(json_codec)
 
     def request(self, verb, url, payload=None, multipart=None):
         headers = {}
         data = None
         if payload:
             headers['Content-Type'] = 'application/json'
-            data = utils.to_json(payload)
+            data = self.codec.encode(payload)
 
         if multipart is not None:
             data = {'payload_json': multipart.pop('payload_json')}
 
         for tries in range(5):
             r = self.session.request(verb, url, headers=headers, data=data, files=multipart)
-            r.encoding = 'utf-8'
-            data = r.text
+            data = r.content
 
             # compatibility with aiohttp
             r.status = r.status_code
 
             if r.headers['Content-Type'] == 'application/json':
-                data = json.loads(data)
+                data = self.codec.loads(data)
+            else:
+                data = data.decode('utf-8')
 
             # check if we have rate limit header information
             remaining = r.headers.get('X-Ratelimit-Remaining')
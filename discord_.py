@@ -1,7 +1,22 @@
+import os
+import time
 import discord
-from rasa_api import call_for
+from discord import tracing
+from rasa_api import classify, enable_routing, set_tracer, warm_up, ClassifierBusy
+from discord_prefilter import Prefilter
+from discord_replies import ReplyRegistry
+from discord_coalesce import ReplyCoalescer
 token = 'your token'
+started = time.perf_counter()
 client = discord.Client()
+if os.environ.get('BOT_TRACE'):
+    # per-stage latency histograms, e.g. BOT_TRACE=trace.json
+    tracing.enable(os.environ['BOT_TRACE'])
+# classifier queue and model stages, recorded only while tracing is on
+set_tracer(tracing.tracer)
+enable_routing()
+prefilter = Prefilter.default(client)
+replies = ReplyRegistry(coalescer=ReplyCoalescer(http=client.http))
 @client.event  
 async def on_ready():  
     print('Ready to talk to bot') 
@@ -9,24 +24,37 @@ async def on_ready():
 @client.event
 async def on_message(message):
     print(f"{message.author}, {message.content}")
-    message_info = call_for(message.content)
-    data = message_info['intent']['name']
-    if message.author == client.user:
+    if not prefilter.check(message):
+        return
+    try:
+        with tracing.span('bot.classify'):
+            message_info = await classify(message.content)
+    except ClassifierBusy:
+        print(f'Dropped message from {message.author}, classifier is busy')
         return
-    # check confidence here
-    if data == 'greet':
-        return await message.channel.send(f'{message.author.mention} Hey! welcome to python.learning')
-    elif data == 'goodbye':
-        return await message.channel.send(f'Bye, See you later, {message.author.mention}')
-    elif data == 'abuse':
-        return await message.channel.send(f'{message.author.mention} It\'s a warning, don\'t use abusive words')
-    elif data == 'machine_learning':
-        return await message.channel.send('YouTubers: \n0. Siraj Raval \n1. PyData \nBooks:\n0. Programming Collective Intelligence: Building Smart Web 2.0 Applications - Toby Segaran \n1. Building Machine Learning Systems with Python - Willi Richert, Luis Pedro Coelho \n2. Learning scikit-learn: Machine Learning in Python - Raúl Garreta, Guillermo Moncecchi \n3. Machine Learning in Action - Peter Harrington')
-    elif data == 'youtube':
-        return await message.channel.send('For Machine Learning:\n0. Siraj Raval https://www.youtube.com/channel/UCWN3xxRkmTPmbKwht9FuE5A \n1. Data School https://www.youtube.com/channel/UCnVzApLJE2ljPZSeQylSEyg \n2. Krista King https://www.youtube.com/user/TheIntegralCALC \n3. Professor Leonard https://www.youtube.com/user/professorleonard57 \n4. PyData https://www.youtube.com/user/PyDataTV \n5. The SemiColon https://www.youtube.com/channel/UCwB7HrnRlOfasrbCJoiZ9Lg')
-    elif data == 'book':
-        return await message.channel.send('For Beginners:\n0. Learning Python: Book by David Ascher and Mark Lutz \n1. Python Cookbook: Book by Alex Martelli and others \n2. Learn Python the Hard Way: Book by Zed Shaw \n3. Head First Python : Paul Barry')
-    else:
-        return await message.channel.send(f'We will contact you for the query "{message.content}"')
+    data = message_info['intent']['name']
+    # low confidence centroid answers were already escalated to the full model
+    with tracing.span('bot.reply'):
+        sent = await replies.send(message, data)
+    tracing.tracer.finish('bot.frame_to_reply', message.id)
+    return sent
+
+def startup():
+    """Warms the model and the replies up and prints where the time went.
+
+    Runs before connecting, so the first messages after a deploy are
+    answered at warm latency.
+    """
+    timings = {'setup': time.perf_counter() - started}
+    timings.update(warm_up())
+    start = time.perf_counter()
+    replies.reload()
+    timings['replies'] = time.perf_counter() - start
+    total = time.perf_counter() - started
+    print('Started in %.0fms (%s)' % (1000 * total, ', '.join(
+        '%s %.0fms' % (stage, 1000 * seconds) for stage, seconds in timings.items())))
+    return timings
 
-client.run(token)
\ No newline at end of file
+if __name__ == '__main__':
+    startup()
+    client.run(token)
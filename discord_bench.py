@@ -0,0 +1,308 @@
+"""Benchmark of the gateway codecs in ``discord.codec`` and ``discord.etf``.
+
+Decodes READY and GUILD_CREATE gateway frames from bytes, the way the
+gateway gets them out of zlib, and encodes them back as request bodies.
+The stdlib path the gateway used before (decode to ``str``, then parse)
+is timed too, as ``json+decode``.
+
+For ``etf`` every frame is first converted the way the gateway sends it
+with ``encoding=etf`` (snowflakes as integers). The round trip itself is
+tested in ``tests/test_etf.py``.
+
+Frames are synthesized for ``--guilds`` guilds of ``--members`` members
+by default. ``--frames`` reads recorded ones instead, one frame per line,
+for example written by a ``socket_response`` listener::
+
+    @client.event
+    async def on_socket_response(msg):
+        if msg.get('t') in ('READY', 'GUILD_CREATE'):
+            frames.write(json.dumps(msg) + '\\n')
+
+    $ python discord_bench.py --guilds 20 --members 1000
+
+``--zlib`` instead replays a zlib-stream session, the READY and
+GUILD_CREATE frames followed by ``--messages`` MESSAGE_CREATEs, through
+``ZlibStreamAssembler`` and through the assembly the gateway used before
+(extend a buffer, inflate it, decode to ``str``, start a new buffer),
+and compares time, peak traced memory and bytes copied. ``--split``
+cuts frames into websocket messages of at most that many bytes.
+``--session`` replays a recorded session instead, written as 4-byte
+big-endian length prefixed messages by a ``socket_raw_receive``
+listener::
+
+    @client.event
+    async def on_socket_raw_receive(msg):
+        if type(msg) is bytes:
+            session.write(len(msg).to_bytes(4, 'big') + msg)
+
+    $ python discord_bench.py --zlib --messages 5000 --split 4096
+
+``--events N`` replays N presence-heavy events (80% PRESENCE_UPDATE,
+10% TYPING_START, 5% MESSAGE_REACTION_ADD, 5% MESSAGE_CREATE) into a
+client that only handles ``on_message``, with and without selective
+event processing, and compares the parse time per event type::
+
+    $ python discord_bench.py --events 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+import zlib
+
+import discord
+from discord import codec, etf
+from discord.gateway import ZLIB_SUFFIX, ZlibStreamAssembler
+
+from discord_load import GatewayFeed
+
+
+def _best(func, items, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def etf_term(value):
+    """``value`` as the gateway would send it as ETF, snowflakes as ints.
+
+    ``tests/test_etf.py`` converts its recorded frames with this too.
+    """
+    if isinstance(value, dict):
+        return {key: etf_term(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [etf_term(item) for item in value]
+    if isinstance(value, str) and len(value) >= 15 and value.isdigit():
+        return int(value)
+    return value
+
+
+def available_codecs():
+    codecs = []
+    for name in ('json', 'orjson'):
+        try:
+            codecs.append(codec.get_codec(name))
+        except ImportError:
+            print('%s is not installed, skipping it' % name)
+    return codecs
+
+
+def run(frames, repeat=5):
+    """Times every codec on ``frames`` (UTF-8 bytes) and returns the results."""
+    size = sum(len(frame) for frame in frames)
+    documents = [json.loads(frame) for frame in frames]
+    timings = {'json+decode': {'loads': _best(lambda frame: json.loads(frame.decode('utf-8')), frames, repeat)}}
+    for c in available_codecs():
+        timings[c.name] = {
+            'loads': _best(c.loads, frames, repeat),
+            'encode': _best(c.encode, documents, repeat),
+        }
+    terms = [etf_term(document) for document in documents]
+    etf_frames = [etf.dumps(term) for term in terms]
+    timings['etf'] = {
+        'loads': _best(etf.loads, etf_frames, repeat),
+        'encode': _best(etf.dumps, terms, repeat),
+    }
+
+    results = {'frames': len(frames), 'bytes': size, 'etf_bytes': sum(map(len, etf_frames)), 'codecs': {}}
+    for name, times in timings.items():
+        results['codecs'][name] = {
+            op: {'ms': 1000 * seconds, 'mb_per_sec': size / seconds / 1e6}
+            for op, seconds in times.items()
+        }
+    return results
+
+
+def compress_session(frames, split=None):
+    """Compresses ``frames`` as one zlib-stream and returns the websocket messages."""
+    compressor = zlib.compressobj()
+    messages = []
+    for frame in frames:
+        data = compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        step = split or len(data)
+        messages.extend(data[i:i + step] for i in range(0, len(data), step))
+    return messages
+
+
+def read_session(path):
+    messages = []
+    with open(path, 'rb') as fp:
+        while True:
+            header = fp.read(4)
+            if len(header) < 4:
+                return messages
+            messages.append(fp.read(int.from_bytes(header, 'big')))
+
+
+def legacy_assemble(messages):
+    """The assembly ``DiscordWebSocket.received_message`` did before ``ZlibStreamAssembler``."""
+    inflater = zlib.decompressobj()
+    buffer = bytearray()
+    copied = 0
+    for msg in messages:
+        buffer.extend(msg)
+        copied += len(msg)
+        if len(msg) >= 4 and msg[-4:] == ZLIB_SUFFIX:
+            frame = inflater.decompress(buffer).decode('utf-8')
+            copied += len(frame)
+            buffer = bytearray()
+    return copied
+
+
+def assemble(messages):
+    assembler = ZlibStreamAssembler()
+    feed = assembler.feed
+    for msg in messages:
+        feed(msg)
+    return assembler.counters
+
+
+def _peak_memory(func, messages):
+    tracemalloc.start()
+    try:
+        func(messages)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_zlib(messages, repeat=5):
+    """Times both assemblies on one session and returns the results."""
+    counters = assemble(messages)
+    results = {'counters': counters.to_dict(), 'assembly': {}}
+    for name, func, copied in (('legacy', legacy_assemble, legacy_assemble(messages)),
+                               ('assembler', assemble, _buffered_bytes(messages))):
+        results['assembly'][name] = {
+            'ms': 1000 * _best(func, [messages], repeat),
+            'peak_kb': _peak_memory(func, messages) / 1024,
+            'copied_kb': copied / 1024,
+        }
+    return results
+
+
+def _buffered_bytes(messages):
+    # the assembler only copies the messages of frames split over several
+    copied = pending = 0
+    parts = 0
+    for msg in messages:
+        pending += len(msg)
+        parts += 1
+        if msg[-4:] == ZLIB_SUFFIX:
+            if parts > 1:
+                copied += pending
+            pending = parts = 0
+    return copied
+
+
+EVENT_MIX = (
+    ('PRESENCE_UPDATE', 80),
+    ('TYPING_START', 10),
+    ('MESSAGE_REACTION_ADD', 5),
+    ('MESSAGE_CREATE', 5),
+)
+
+
+def replay_events(count, selective, seed=0, **feed_options):
+    """Parses ``count`` events from :data:`EVENT_MIX` and returns the client's event stats."""
+    client = discord.Client(selective_events=selective)
+    client._connection.is_bot = True
+
+    @client.event
+    async def on_message(message):
+        pass
+
+    feed = GatewayFeed(client, seed=seed, **feed_options)
+    for frame in feed.ready_frames():
+        feed.feed(frame)
+
+    builders = {
+        'PRESENCE_UPDATE': feed.presence_frame,
+        'TYPING_START': feed.typing_frame,
+        'MESSAGE_REACTION_ADD': feed.reaction_frame,
+        'MESSAGE_CREATE': lambda: feed.message_frame()[1],
+    }
+    events, weights = zip(*EVENT_MIX)
+    frames = [builders[event]() for event in feed.rng.choices(events, weights, k=count)]
+    decoded = [json.loads(frame) for frame in frames]
+
+    state = client._connection
+    state._event_stats.clear()
+    start = time.perf_counter()
+    for msg in decoded:
+        state.parse(msg['t'], msg['d'])
+    elapsed = time.perf_counter() - start
+
+    # let the dispatched on_message tasks finish
+    client.loop.run_until_complete(asyncio.sleep(0))
+    client.loop.run_until_complete(client.http.close())
+    return elapsed, state.event_stats()
+
+
+def print_events(args):
+    print('%d events, %d guilds of %d members' % (args.events, args.guilds, args.members))
+    for name, selective in (('everything', False), ('selective', True)):
+        elapsed, stats = replay_events(args.events, selective, guilds=args.guilds,
+                                       channels=args.channels, members=args.members)
+        print('%-10s %8.1fms total  ' % (name, 1000 * elapsed) + '  '.join(
+            '%s %.1fus' % (event, stats[event]['mean_us']) for event, _ in EVENT_MIX if event in stats))
+
+
+def print_codecs(args):
+    if args.frames:
+        with open(args.frames, 'rb') as fp:
+            frames = [line.rstrip(b'\n') for line in fp if line.strip()]
+    else:
+        feed = GatewayFeed(None, guilds=args.guilds, channels=args.channels, members=args.members, texts=['-'])
+        frames = [frame.encode('utf-8') for frame in feed.ready_frames()]
+
+    results = run(frames, args.repeat)
+    print('%d frames, %.1f KB as JSON, %.1f KB as ETF' % (
+        results['frames'], results['bytes'] / 1024, results['etf_bytes'] / 1024))
+    for name, ops in results['codecs'].items():
+        print('%-12s ' % name + '   '.join(
+            '%s %7.2fms %6.1f MB/s' % (op, r['ms'], r['mb_per_sec']) for op, r in ops.items()))
+
+
+def print_zlib(args):
+    if args.session:
+        messages = read_session(args.session)
+    else:
+        feed = GatewayFeed(None, guilds=args.guilds, channels=args.channels, members=args.members)
+        frames = list(feed.ready_frames()) + [feed.message_frame()[1] for _ in range(args.messages)]
+        messages = compress_session([frame.encode('utf-8') for frame in frames], args.split)
+
+    results = run_zlib(messages, args.repeat)
+    counters = results['counters']
+    print('%d messages, %d frames (%d split), %.1f KB in, %.1f KB inflated' % (
+        counters['messages'], counters['frames'], counters['buffered_frames'],
+        counters['bytes_in'] / 1024, counters['bytes_decompressed'] / 1024))
+    for name, r in results['assembly'].items():
+        print('%-10s %8.2fms   peak %8.1f KB   copied %9.1f KB' % (name, r['ms'], r['peak_kb'], r['copied_kb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--frames', help='file with one recorded gateway frame per line')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--channels', type=int, default=20, help='text channels per guild')
+    parser.add_argument('--members', type=int, default=500, help='members per guild')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--zlib', action='store_true', help='benchmark zlib-stream frame assembly instead')
+    parser.add_argument('--messages', type=int, default=2000, help='MESSAGE_CREATEs in the --zlib session')
+    parser.add_argument('--split', type=int, help='split --zlib frames into messages of this many bytes')
+    parser.add_argument('--session', help='recorded zlib-stream session for --zlib')
+    parser.add_argument('--events', type=int, help='benchmark selective event processing on this many events')
+    args = parser.parse_args()
+
+    if args.events:
+        print_events(args)
+    elif args.zlib:
+        print_zlib(args)
+    else:
+        print_codecs(args)
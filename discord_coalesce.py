@@ -0,0 +1,193 @@
+"""Merges bursts of replies to the same channel into fewer messages.
+
+Every ``channel.send`` is a ``POST /channels/{id}/messages`` request, and
+they all share one rate limit bucket per channel. When a busy channel
+gets a burst of greetings, sending one message per reply mostly means
+waiting on that bucket. :class:`ReplyCoalescer` sends a reply to a quiet
+channel right away, and holds the replies that come in while a send to
+the channel is still in progress. Once it finishes they go out as one
+line each in as few messages as the 2000 character limit allows, with
+lines that are exact repeats of one already in the batch dropped. A
+channel that is not busy never waits for a batch to fill.
+
+``python discord_coalesce.py`` runs a burst against a simulated rate
+limited channel, with and without coalescing, and prints the REST calls
+and 429s of both.
+"""
+import asyncio
+import collections
+import functools
+import sys
+import time
+
+MESSAGE_LIMIT = 2000
+
+
+class ReplyCoalescer:
+    """Buffers replies per channel and sends each batch merged.
+
+    ``http`` is the client's ``HTTPClient``; when given, :meth:`stats`
+    includes its request and 429 counters.
+    """
+
+    def __init__(self, limit=MESSAGE_LIMIT, http=None):
+        self.limit = limit
+        self.http = http
+        self._pending = {}
+        # channel id -> [lock, flushes using it], dropped when unused
+        self._locks = {}
+        self.replies = 0
+        self.sends = 0
+        self.duplicates = 0
+
+    async def send(self, channel, content, body=None):
+        """Queues ``content`` for ``channel`` and returns the message it went out in.
+
+        ``body`` is the pre-encoded request for ``content`` alone; it is
+        used when the reply ends up in a batch by itself.
+        """
+        future = asyncio.get_event_loop().create_future()
+        pending = self._pending.get(channel.id)
+        if pending is None:
+            pending = self._pending[channel.id] = []
+            flush = asyncio.ensure_future(self._flush(channel, pending))
+            flush.add_done_callback(functools.partial(self._abandon, channel.id, pending))
+        pending.append((content, body, future))
+        self.replies += 1
+        return await future
+
+    def _abandon(self, channel_id, batch, flush):
+        # the flush was cancelled, possibly before it started, or died
+        # of a BaseException; don't leave send() waiting
+        if self._pending.get(channel_id) is batch:
+            del self._pending[channel_id]
+        for _, _, future in batch:
+            if not future.done():
+                future.cancel()
+
+    def _chunks(self, batch):
+        """Yields ``(content, body, futures)`` for every message to send."""
+        if len(batch) == 1:
+            content, body, future = batch[0]
+            yield content, body, [future]
+            return
+
+        lines = collections.OrderedDict()
+        for content, _, future in batch:
+            if content in lines:
+                self.duplicates += 1
+            lines.setdefault(content, []).append(future)
+
+        chunk, futures, size = [], [], 0
+        for line, waiting in lines.items():
+            if chunk and size + 1 + len(line) > self.limit:
+                yield '\n'.join(chunk), None, futures
+                chunk, futures, size = [], [], 0
+            while len(line) > self.limit:
+                yield line[:self.limit], None, []
+                line = line[self.limit:]
+            chunk.append(line)
+            futures.extend(waiting)
+            size += len(line) + (1 if size else 0)
+        if chunk:
+            yield '\n'.join(chunk), None, futures
+
+    async def _flush(self, channel, batch):
+        entry = self._locks.get(channel.id)
+        if entry is None:
+            entry = self._locks[channel.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # free unless an earlier batch for the channel is being sent;
+            # until then, new replies join this batch
+            async with entry[0]:
+                del self._pending[channel.id]
+                for content, body, futures in self._chunks(batch):
+                    if body is not None:
+                        message = await channel.send_encoded(body)
+                    else:
+                        message = await channel.send(content)
+                    self.sends += 1
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(message)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[channel.id]
+
+    def stats(self):
+        stats = {
+            'replies': self.replies,
+            'sends': self.sends,
+            'saved': self.replies - self.sends - sum(map(len, self._pending.values())),
+            'duplicates': self.duplicates,
+        }
+        if self.http is not None:
+            stats['requests'] = self.http.requests_sent
+            stats['rate_limited'] = self.http.rate_limited
+        return stats
+
+
+class _SimulatedChannel:
+    """A channel whose sends share a bucket of ``rate`` messages per ``per`` seconds."""
+
+    def __init__(self, id, counters, rate=5, per=1.0):
+        self.id = id
+        self.counters = counters
+        self.rate = rate
+        self.per = per
+        self.sent = []
+        self._lock = asyncio.Lock()
+        self._window_start = 0.0
+        self._used = 0
+
+    async def send(self, content):
+        async with self._lock:
+            while True:
+                self.counters['requests'] += 1
+                now = time.monotonic()
+                if now - self._window_start >= self.per:
+                    self._window_start, self._used = now, 0
+                if self._used < self.rate:
+                    self._used += 1
+                    self.sent.append(content)
+                    return content
+                self.counters['rate_limited'] += 1
+                await asyncio.sleep(self._window_start + self.per - now)
+
+    async def send_encoded(self, body):
+        return await self.send(body)
+
+
+async def simulate(replies=60, channels=3, coalesce=True, rate=5, per=1.0):
+    """Sends a burst of greetings and returns the request and 429 counters."""
+    counters = collections.Counter()
+    targets = [_SimulatedChannel(i, counters, rate, per) for i in range(channels)]
+    coalescer = ReplyCoalescer() if coalesce else None
+
+    async def reply(i):
+        channel = targets[i % channels]
+        content = '<@%d> Hey! welcome to python.learning' % i
+        if coalescer is None:
+            return await channel.send(content)
+        return await coalescer.send(channel, content)
+
+    start = time.monotonic()
+    await asyncio.gather(*(reply(i) for i in range(replies)))
+    counters['seconds'] = time.monotonic() - start
+    counters['messages'] = sum(len(channel.sent) for channel in targets)
+    return counters
+
+
+if __name__ == '__main__':
+    replies = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    for name, coalesce in (('direct', False), ('coalesced', True)):
+        counters = asyncio.run(simulate(replies, coalesce=coalesce))
+        print('%-10s %3d replies -> %3d messages, %3d requests, %3d 429s, %.2fs' % (
+            name, replies, counters['messages'], counters['requests'], counters['rate_limited'],
+            counters['seconds']))
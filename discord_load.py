@@ -0,0 +1,363 @@
+"""Offline load test of the whole bot.
+
+Runs ``discord_.py``'s client without Discord: READY, GUILD_CREATE and
+then MESSAGE_CREATE events are built here, encoded as gateway frames and
+fed through the ``ConnectionState`` parsers. Replies go to
+:class:`RestStandIn`, a local HTTP server that answers message sends the
+way the REST API does, so ``HTTPClient`` runs unchanged, locks and rate
+limit handling included.
+
+Messages are fed at ``--rate`` per second for ``--duration`` seconds,
+with texts from ``dataset.json`` and random authors and channels. The
+report has the sustained messages per second, the latency from feeding
+an event to its handler finishing (the reply included), and the event
+loop lag::
+
+    $ python discord_load.py --rate 200 --duration 30 --out load.json
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import random
+import time
+
+from aiohttp import web
+
+import discord
+from discord.http import Route
+
+from rasa_api import DATASET, load_examples, percentile
+
+BOT_ID = 100000000000000001
+
+
+def _user(user_id, name, bot=False):
+    return {'id': str(user_id), 'username': name, 'discriminator': '%04d' % (user_id % 10000),
+            'avatar': None, 'bot': bot}
+
+
+def _json_response(data, status=200):
+    # HTTPClient only decodes bodies sent as exactly "application/json"
+    return web.Response(body=json.dumps(data).encode('utf-8'), status=status,
+                        headers={'Content-Type': 'application/json'})
+
+
+def _timestamp():
+    return datetime.datetime.utcnow().isoformat() + '+00:00'
+
+
+class RestStandIn:
+    """Local stand-in for the message endpoints of the Discord REST API.
+
+    With ``rate`` set, every channel accepts ``rate`` messages per ``per``
+    seconds and answers 429 beyond that, like Discord's message bucket.
+    """
+
+    def __init__(self, latency=0.0, rate=None, per=5.0):
+        self.latency = latency
+        self.rate = rate
+        self.per = per
+        self.requests = 0
+        self.messages = 0
+        self.rate_limited = 0
+        self._ids = itertools.count(200000000000000000)
+        self._buckets = {}
+        self._runner = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Starts serving and returns the base URL to use for ``Route.BASE``."""
+        app = web.Application()
+        app.router.add_post('/api/v7/channels/{channel_id}/messages', self.create_message)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return 'http://%s:%d/api/v7' % (host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _limited(self, channel_id):
+        if self.rate is None:
+            return None
+        now = time.monotonic()
+        start, used = self._buckets.get(channel_id, (now, 0))
+        if now - start >= self.per:
+            start, used = now, 0
+        if used >= self.rate:
+            return start + self.per - now
+        self._buckets[channel_id] = (start, used + 1)
+        return None
+
+    async def create_message(self, request):
+        self.requests += 1
+        channel_id = request.match_info['channel_id']
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        retry_after = self._limited(channel_id)
+        if retry_after is not None:
+            self.rate_limited += 1
+            return _json_response({'message': 'You are being rate limited.', 'global': False,
+                                   'retry_after': int(retry_after * 1000) + 1}, status=429)
+
+        self.messages += 1
+        return _json_response({
+            'id': str(next(self._ids)),
+            'channel_id': channel_id,
+            'author': _user(BOT_ID, 'bot', bot=True),
+            'content': payload.get('content', ''),
+            'embeds': [payload['embed']] if 'embed' in payload else [],
+            'timestamp': _timestamp(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'pinned': False,
+            'type': 0,
+        })
+
+
+class GatewayFeed:
+    """Builds gateway frames for a set of synthetic guilds and feeds them to a client."""
+
+    def __init__(self, client, guilds=5, channels=10, members=200, texts=None, seed=0):
+        self.client = client
+        self.state = client._connection if client is not None else None
+        self.rng = random.Random(seed)
+        self.texts = texts or [text for text, _ in load_examples(DATASET)]
+        self._ids = itertools.count(300000000000000000)
+        self._recent = collections.deque(maxlen=100)
+        self.guilds = []
+        for g in range(guilds):
+            guild_id = next(self._ids)
+            self.guilds.append({
+                'id': guild_id,
+                'channels': [next(self._ids) for _ in range(channels)],
+                'members': [next(self._ids) for _ in range(members)],
+            })
+
+    def feed(self, frame):
+        """Decodes one frame and runs it through its ``ConnectionState`` parser."""
+        msg = json.loads(frame)
+        self.state.parse(msg['t'], msg['d'])
+        return msg['d']
+
+    def _frame(self, event, data):
+        return json.dumps({'op': 0, 't': event, 's': None, 'd': data})
+
+    def ready_frames(self):
+        yield self._frame('READY', {
+            'v': 6,
+            'user': _user(BOT_ID, 'bot', bot=True),
+            'session_id': 'load',
+            'guilds': [{'id': str(g['id']), 'unavailable': True} for g in self.guilds],
+            'private_channels': [],
+            'relationships': [],
+            '_trace': ['discord_load'],
+        })
+        for g in self.guilds:
+            yield self._frame('GUILD_CREATE', {
+                'id': str(g['id']),
+                'name': 'load %d' % g['id'],
+                'unavailable': False,
+                'member_count': len(g['members']) + 1,
+                'owner_id': str(BOT_ID),
+                'region': 'us-east',
+                'verification_level': 0,
+                'roles': [{'id': str(g['id']), 'name': '@everyone', 'permissions': 104324161,
+                           'position': 0, 'color': 0, 'hoist': False, 'managed': False,
+                           'mentionable': False}],
+                'emojis': [],
+                'channels': [{'id': str(c), 'type': 0, 'name': 'channel-%d' % i, 'position': i,
+                              'permission_overwrites': []} for i, c in enumerate(g['channels'])],
+                'members': [{'user': _user(m, 'user%d' % m), 'roles': [], 'joined_at': _timestamp(),
+                             'deaf': False, 'mute': False} for m in g['members'] + [BOT_ID]],
+                'presences': [],
+                'voice_states': [],
+            })
+
+    def message_frame(self):
+        guild = self.rng.choice(self.guilds)
+        author = self.rng.choice(guild['members'])
+        message_id = next(self._ids)
+        channel_id = self.rng.choice(guild['channels'])
+        self._recent.append((guild, channel_id, message_id))
+        return message_id, self._frame('MESSAGE_CREATE', {
+            'id': str(message_id),
+            'channel_id': str(channel_id),
+            'guild_id': str(guild['id']),
+            'author': _user(author, 'user%d' % author),
+            'content': self.rng.choice(self.texts),
+            'timestamp': _timestamp(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+        })
+
+    def presence_frame(self):
+        guild = self.rng.choice(self.guilds)
+        return self._frame('PRESENCE_UPDATE', {
+            'user': {'id': str(self.rng.choice(guild['members']))},
+            'guild_id': str(guild['id']),
+            'status': self.rng.choice(['online', 'idle', 'dnd', 'offline']),
+            'game': self.rng.choice([None, {'name': 'a game', 'type': 0}, {'name': 'music', 'type': 2}]),
+            'roles': [],
+            'nick': None,
+        })
+
+    def typing_frame(self):
+        guild = self.rng.choice(self.guilds)
+        return self._frame('TYPING_START', {
+            'channel_id': str(self.rng.choice(guild['channels'])),
+            'guild_id': str(guild['id']),
+            'user_id': str(self.rng.choice(guild['members'])),
+            'timestamp': int(time.time()),
+        })
+
+    def reaction_frame(self):
+        """A reaction to one of the last messages, or to an uncached one when there are none."""
+        if self._recent:
+            guild, channel_id, message_id = self.rng.choice(self._recent)
+        else:
+            guild = self.rng.choice(self.guilds)
+            channel_id, message_id = self.rng.choice(guild['channels']), next(self._ids)
+        return self._frame('MESSAGE_REACTION_ADD', {
+            'user_id': str(self.rng.choice(guild['members'])),
+            'channel_id': str(channel_id),
+            'message_id': str(message_id),
+            'guild_id': str(guild['id']),
+            'emoji': {'id': None, 'name': '\N{THUMBS UP SIGN}', 'animated': False},
+        })
+
+
+async def _monitor_lag(samples, interval=0.01):
+    loop = asyncio.get_event_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def run(bot, rate=100.0, duration=10.0, rest=None, drain=10.0, **feed_options):
+    """Drives ``bot`` (the ``discord_`` module) and returns the measurements."""
+    client = bot.client
+    rest = rest or RestStandIn()
+    Route.BASE = await rest.start()
+    client.http.token = 'load'
+    client.http.bot_token = True
+    client._connection.is_bot = True
+
+    feed = GatewayFeed(client, **feed_options)
+    for frame in feed.ready_frames():
+        feed.feed(frame)
+    await client.wait_until_ready()
+
+    fed_at = {}
+    latencies = []
+    handler = client.on_message
+
+    async def on_message(message):
+        await handler(message)
+        start = fed_at.pop(message.id, None)
+        if start is not None:
+            latencies.append(time.perf_counter() - start)
+
+    client.on_message = on_message
+    lag = []
+    monitor = asyncio.ensure_future(_monitor_lag(lag))
+
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    fed = 0
+    for fed in itertools.count(1):
+        due = start + fed / rate
+        if due - start > duration:
+            fed -= 1
+            break
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        message_id, frame = feed.message_frame()
+        fed_at[message_id] = time.perf_counter()
+        feed.feed(frame)
+    fed_time = loop.time() - start
+
+    deadline = loop.time() + drain
+    while len(latencies) < fed and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = loop.time() - start
+    monitor.cancel()
+    await client.http.close()
+    await rest.stop()
+
+    return {
+        'target_rate': rate,
+        'fed': fed,
+        'feed_seconds': fed_time,
+        'handled': len(latencies),
+        'unfinished': fed - len(latencies),
+        'msgs_per_sec': len(latencies) / elapsed if elapsed else 0.0,
+        'replies': rest.messages,
+        'rest_requests': rest.requests,
+        'rate_limited': rest.rate_limited,
+        'latency_ms': {
+            'p50': 1000 * percentile(latencies, 50),
+            'p95': 1000 * percentile(latencies, 95),
+            'p99': 1000 * percentile(latencies, 99),
+            'max': 1000 * max(latencies, default=0.0),
+        },
+        'loop_lag_ms': {
+            'p50': 1000 * percentile(lag, 50),
+            'p99': 1000 * percentile(lag, 99),
+            'max': 1000 * max(lag, default=0.0),
+        },
+        'events': client._connection.event_stats(),
+        'prefilter': bot.prefilter.stats(),
+        'replies_sent': bot.replies.stats(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rate', type=float, default=100.0, help='messages per second to feed')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--channels', type=int, default=10, help='text channels per guild')
+    parser.add_argument('--members', type=int, default=200, help='members per guild')
+    parser.add_argument('--rest-latency', type=float, default=0.0, help='seconds the REST stand-in takes per request')
+    parser.add_argument('--rest-rate', type=int, help='messages per channel per 5 seconds before 429s')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', help='also record per-stage latency histograms to this file')
+    parser.add_argument('--out', help='write the results as JSON to this path')
+    args = parser.parse_args()
+
+    if args.trace:
+        discord.tracing.enable(args.trace)
+
+    import discord_
+
+    discord_.startup()
+    rest = RestStandIn(args.rest_latency, args.rest_rate)
+    results = discord_.client.loop.run_until_complete(run(
+        discord_, args.rate, args.duration, rest,
+        guilds=args.guilds, channels=args.channels, members=args.members, seed=args.seed))
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fp:
+            json.dump(results, fp, indent=2)
@@ -0,0 +1,117 @@
+"""Cheap checks that keep messages away from the intent model.
+
+A :class:`Prefilter` runs each message through its stages in order and
+stops at the first one that rejects it. Every stage has its own counter,
+so :meth:`Prefilter.stats` shows how many classifications each one saved.
+"""
+import collections
+import time
+
+
+class IgnoreSelf:
+    """Drops messages the bot sent itself."""
+    name = 'self'
+
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, message):
+        user = self.client.user
+        return user is None or message.author.id != user.id
+
+
+class IgnoreBots:
+    """Drops messages from bot accounts, including webhooks."""
+    name = 'bots'
+
+    def __call__(self, message):
+        return not message.author.bot
+
+
+class RequireText:
+    """Drops empty and attachment-only messages."""
+    name = 'no_text'
+
+    def __call__(self, message):
+        return bool(message.content and message.content.strip())
+
+
+class MaxLength:
+    """Drops messages longer than ``limit`` characters."""
+    name = 'too_long'
+
+    def __init__(self, limit=500):
+        self.limit = limit
+
+    def __call__(self, message):
+        return len(message.content) <= self.limit
+
+
+class DropDuplicates:
+    """Drops a message when its author sent the same text within ``window`` seconds."""
+    name = 'duplicate'
+
+    def __init__(self, window=10.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._seen = collections.OrderedDict()
+
+    def __call__(self, message):
+        now = self.clock()
+        seen = self._seen
+        # entries are kept in the order they were let through, so the
+        # expired ones are always at the front
+        while seen:
+            key, stamp = next(iter(seen.items()))
+            if now - stamp < self.window:
+                break
+            del seen[key]
+
+        key = (message.author.id, message.content)
+        if key in seen:
+            # the window runs from the copy that was let through, repeats
+            # don't extend it
+            return False
+        seen[key] = now
+        return True
+
+
+class Prefilter:
+    """Runs messages through ``stages`` until one of them rejects it.
+
+    A stage is any callable taking a message and returning ``True`` to
+    keep it, optionally with a ``name`` attribute for the counters.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.checked = 0
+        self.passed = 0
+        self.dropped = collections.Counter()
+
+    @classmethod
+    def default(cls, client, *, max_length=500, duplicate_window=10.0):
+        return cls([
+            IgnoreSelf(client),
+            IgnoreBots(),
+            RequireText(),
+            MaxLength(max_length),
+            DropDuplicates(duplicate_window),
+        ])
+
+    def check(self, message):
+        """Returns ``True`` if ``message`` should be classified."""
+        self.checked += 1
+        for stage in self.stages:
+            if not stage(message):
+                self.dropped[getattr(stage, 'name', type(stage).__name__)] += 1
+                return False
+        self.passed += 1
+        return True
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'passed': self.passed,
+            'dropped': dict(self.dropped),
+        }
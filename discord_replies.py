@@ -0,0 +1,144 @@
+"""Canned replies, encoded once and reused for every send.
+
+``replies.json`` maps intent names to a reply with ``content`` and/or
+``embed`` (in the dict form of :class:`discord.Embed`). The ``default``
+entry answers any intent without its own reply. Each reply is encoded
+to its final JSON request body when the file is loaded. Replies that
+use ``{mention}`` or ``{content}`` are split around the placeholders, so
+sending one only joins the JSON-escaped values in. The others are sent
+as the same ``bytes`` object every time.
+
+:class:`ReplyRegistry` stats the file on every lookup and reloads it when
+it changed, so replies can be edited while the bot is running. With a
+:class:`discord_coalesce.ReplyCoalescer`, replies without an embed are
+merged per channel before they are sent.
+"""
+import json
+import os
+import re
+
+import discord
+
+REPLIES = 'replies.json'
+DEFAULT = 'default'
+
+PLACEHOLDER = re.compile(r'\{(mention|content)\}')
+
+
+def _escape(value):
+    # the JSON string literal without its quotes
+    return discord.utils.to_json(value)[1:-1]
+
+
+class Reply:
+    """One reply, pre-encoded as a ``POST /channels/{id}/messages`` body."""
+
+    def __init__(self, content=None, embed=None):
+        if content is None and embed is None:
+            raise ValueError('a reply needs content or an embed')
+        payload = {}
+        if content is not None:
+            payload['content'] = content
+        if embed is not None:
+            payload['embed'] = discord.Embed.from_data(embed).to_dict()
+
+        parts = PLACEHOLDER.split(discord.utils.to_json(payload))
+        self.static = len(parts) == 1
+        self.body = parts[0].encode('ascii') if self.static else None
+        self.parts = parts
+        self.content_parts = PLACEHOLDER.split(content or '')
+        self.has_embed = embed is not None
+
+    @staticmethod
+    def _fill(parts, message, escape):
+        parts = parts[:]
+        for i in range(1, len(parts), 2):
+            if parts[i] == 'mention':
+                parts[i] = message.author.mention
+            else:
+                parts[i] = escape(message.content)
+        return ''.join(parts)
+
+    def render(self, message):
+        """Returns the request body for a reply to ``message``."""
+        if self.static:
+            return self.body
+        return self._fill(self.parts, message, _escape).encode('ascii')
+
+    def text(self, message):
+        """Returns the reply's content for ``message`` as plain text."""
+        return self._fill(self.content_parts, message, str)
+
+
+class ReplyRegistry:
+    """Intent name to :class:`Reply` lookup over a hot-reloaded JSON file."""
+
+    def __init__(self, path=REPLIES, coalescer=None):
+        self.path = path
+        self.coalescer = coalescer
+        self.mtime = None
+        self.replies = {}
+        self.reloads = 0
+        self.sent = 0
+        self.rendered = 0
+
+    @staticmethod
+    def _load_entry(intent, entry):
+        if not isinstance(entry, dict):
+            raise ValueError('reply %r is not an object' % intent)
+        content, embed = entry.get('content'), entry.get('embed')
+        if not isinstance(content, (str, type(None))):
+            raise ValueError('content of reply %r is not a string' % intent)
+        if not isinstance(embed, (dict, type(None))):
+            raise ValueError('embed of reply %r is not an object' % intent)
+        try:
+            return Reply(content, embed)
+        except (TypeError, KeyError, AttributeError) as e:
+            # Embed.from_data does not check its input
+            raise ValueError('embed of reply %r is invalid: %s' % (intent, e)) from e
+
+    def reload(self):
+        """Loads the replies file, raising ``ValueError`` if any entry is malformed."""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding='utf-8') as fp:
+            entries = json.load(fp)
+        if not isinstance(entries, dict):
+            raise ValueError('%s does not hold an object' % self.path)
+        self.replies = {intent: self._load_entry(intent, entry) for intent, entry in entries.items()}
+        self.mtime = mtime
+        self.reloads += 1
+
+    def get(self, intent):
+        """Returns the reply for ``intent``, or the default one."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = self.mtime
+        if mtime != self.mtime:
+            try:
+                self.reload()
+            except (OSError, ValueError) as e:
+                # keep answering with the replies that were loaded last
+                print(f'Could not reload {self.path}: {e}')
+                self.mtime = mtime
+        return self.replies.get(intent) or self.replies.get(DEFAULT)
+
+    async def send(self, message, intent):
+        """Answers ``message`` in its channel with the reply for ``intent``."""
+        reply = self.get(intent)
+        if reply is None:
+            return None
+        self.sent += 1
+        if not reply.static:
+            self.rendered += 1
+        if self.coalescer is not None and not reply.has_embed:
+            return await self.coalescer.send(message.channel, reply.text(message), reply.render(message))
+        return await message.channel.send_encoded(reply.render(message))
+
+    def stats(self):
+        return {
+            'replies': len(self.replies),
+            'reloads': self.reloads,
+            'sent': self.sent,
+            'rendered': self.rendered,
+        }
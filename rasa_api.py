@@ -1,29 +1,946 @@
-def call():
-    from rasa_nlu.training_data import load_data
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+
+from rasa_keywords import KeywordCascade
+
+MODEL_DIR = 'rasa_nlu_api/default/model'
+DATASET = 'rasa_nlu_api/dataset.json'
+CONFIG = 'rasa_nlu_api/config_pipeline.yml'
+ABUSE_LEXICON = 'rasa_nlu_api/abuse_lexicon.txt'
+
+
+def call(incremental=False, **options):
+    if incremental:
+        import rasa_train
+        return rasa_train.retrain(**options)
+
     from rasa_nlu import config
     from rasa_nlu.components import ComponentBuilder
     from rasa_nlu.model import Trainer
 
     builder = ComponentBuilder(use_cache=True)
 
-    training_data = load_data('./rasa_nlu_api/dataset.json')
-    trainer = Trainer(config.load("./rasa_nlu_api/config_pipeline.yml"), builder)
+    import rasa_dataset
+    training_data = rasa_dataset.load(DATASET).training_data()
+    trainer = Trainer(config.load(CONFIG), builder)
     trainer.train(training_data)
-    model_directory = trainer.persist('./rasa_nlu_api/', fixed_model_name="model")
+    # written next to the live model and swapped in, like an incremental run
+    import rasa_train
+    model_directory = rasa_train.install(trainer)
     print('done')
     return model_directory
 
 # call()
+
+
+def load_examples(path=DATASET, compiled=True):
+    """Returns ``(text, intent)`` pairs from a Rasa JSON training file.
+
+    By default they come from the compiled copy of the file, see
+    :mod:`rasa_dataset`.
+    """
+    if compiled:
+        import rasa_dataset
+        return rasa_dataset.load(path).examples()
+
+    # dataset.json is saved with a BOM
+    with open(path, encoding='utf-8-sig') as fp:
+        data = json.load(fp)
+    return [(e['text'], e['intent']) for e in data['rasa_nlu_data']['common_examples']]
+
+
+def stratified_folds(examples, k=5, seed=0):
+    """Splits ``examples`` into ``k`` folds with every intent spread across them."""
+    by_intent = collections.defaultdict(list)
+    for example in examples:
+        by_intent[example[1]].append(example)
+
+    rng = random.Random(seed)
+    folds = [[] for _ in range(k)]
+    for intent in sorted(by_intent):
+        group = by_intent[intent]
+        rng.shuffle(group)
+        for index, example in enumerate(group):
+            folds[index % k].append(example)
+    return folds
+
+
+def read_trained_at(model_dir=MODEL_DIR):
+    """Returns the ``trained_at`` stamp from a model's metadata.json."""
+    with open(os.path.join(model_dir, 'metadata.json'), encoding='utf-8') as fp:
+        return json.load(fp).get('trained_at')
+
+
+class ModelStamp:
+    """Notices when the model in ``model_dir`` is retrained.
+
+    :meth:`changed` stats ``metadata.json`` and only re-reads it when
+    its mtime moves, so it is cheap enough to call per message.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR):
+        self.model_dir = model_dir
+        self.mtime = None
+        self.trained_at = None
+
+    def changed(self):
+        """Returns ``True`` the first time and whenever ``trained_at`` changes."""
+        try:
+            mtime = os.stat(os.path.join(self.model_dir, 'metadata.json')).st_mtime
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+
+        self.mtime = mtime
+        trained_at = read_trained_at(self.model_dir)
+        if trained_at == self.trained_at:
+            return False
+        self.trained_at = trained_at
+        return True
+
+
+class _LoadedModel:
+    __slots__ = ('interpreter', 'trained_at', 'mtime', 'load_time')
+
+    def __init__(self, interpreter, trained_at, mtime, load_time):
+        self.interpreter = interpreter
+        self.trained_at = trained_at
+        self.mtime = mtime
+        self.load_time = load_time
+
+
+class InterpreterRegistry:
+    """Keeps Rasa interpreters loaded between messages.
+
+    Interpreters are keyed by their absolute model directory and are
+    reloaded only when the model's ``metadata.json`` changes on disk
+    (a retrain rewrites it with a new ``trained_at``).
+
+    Checking for staleness is a single ``os.stat`` call, so a warm
+    :meth:`parse` costs only the pipeline itself.
+
+    ``loader`` takes a model directory and returns an object with a
+    ``parse(text)`` method. It defaults to ``Interpreter.load``.
+    """
+
+    def __init__(self, loader=None):
+        self._lock = threading.RLock()
+        self._models = {}
+        self._builder = None
+        self.loader = loader
+        self.loads = 0
+        self.load_time = 0.0
+        self.warm_hits = 0
+        self.cold_hits = 0
+
+    def _load_interpreter(self, path):
+        from rasa_nlu.components import ComponentBuilder
+        from rasa_nlu.model import Interpreter
+
+        if self._builder is None:
+            self._builder = ComponentBuilder(use_cache=True)
+        return Interpreter.load(path, self._builder)
+
+    def _load(self, path, mtime):
+        loader = self.loader or self._load_interpreter
+
+        start = time.perf_counter()
+        interpreter = loader(path)
+        elapsed = time.perf_counter() - start
+
+        self.loads += 1
+        self.load_time += elapsed
+        return _LoadedModel(interpreter, read_trained_at(path), mtime, elapsed)
+
+    def get(self, model_dir=MODEL_DIR):
+        """Returns a loaded interpreter for ``model_dir``, loading it if needed."""
+        path = os.path.abspath(model_dir)
+        model = self._models.get(path)
+        try:
+            mtime = os.stat(os.path.join(path, 'metadata.json')).st_mtime
+        except OSError:
+            # the directory is being swapped for a retrained model,
+            # keep serving the one already loaded
+            if model is None:
+                raise
+            self.warm_hits += 1
+            return model.interpreter
+
+        if model is not None and model.mtime == mtime:
+            self.warm_hits += 1
+            return model.interpreter
+
+        with self._lock:
+            model = self._models.get(path)
+            if model is None or model.mtime != mtime:
+                if model is not None and read_trained_at(path) == model.trained_at:
+                    # metadata was touched but the model itself is the same
+                    model.mtime = mtime
+                    self.warm_hits += 1
+                else:
+                    model = self._models[path] = self._load(path, mtime)
+                    self.cold_hits += 1
+            else:
+                self.warm_hits += 1
+            return model.interpreter
+
+    def parse(self, text, model_dir=MODEL_DIR):
+        return self.get(model_dir).parse(text)
+
+    def preload(self, model_dir=MODEL_DIR):
+        """Loads ``model_dir`` now and swaps it in for the loaded one.
+
+        Messages keep using the old interpreter until the new one is
+        ready, so nothing waits on the load.
+        """
+        path = os.path.abspath(model_dir)
+        mtime = os.stat(os.path.join(path, 'metadata.json')).st_mtime
+        model = self._load(path, mtime)
+        with self._lock:
+            self._models[path] = model
+        return model.interpreter
+
+    def trained_at(self, model_dir=MODEL_DIR):
+        """Returns the ``trained_at`` stamp of the currently loaded model, if any."""
+        model = self._models.get(os.path.abspath(model_dir))
+        return model and model.trained_at
+
+    def unload(self, model_dir=None):
+        """Drops one loaded model, or every model if ``model_dir`` is ``None``."""
+        with self._lock:
+            if model_dir is None:
+                self._models.clear()
+            else:
+                self._models.pop(os.path.abspath(model_dir), None)
+
+    def stats(self):
+        """Returns load and hit counters as a dict."""
+        return {
+            'models': {path: {'trained_at': m.trained_at, 'load_time': m.load_time}
+                       for path, m in self._models.items()},
+            'loads': self.loads,
+            'load_time': self.load_time,
+            'warm_hits': self.warm_hits,
+            'cold_hits': self.cold_hits,
+        }
+
+
+registry = InterpreterRegistry()
+
+
+def set_engine(name):
+    """Selects the inference engine used by :data:`registry`.
+
+    ``'rasa'`` loads the full Rasa interpreter. ``'numpy'`` loads the
+    TensorFlow-free export written by ``python rasa_numpy.py export``,
+    ``'int8'`` its quantized copy from ``python rasa_numpy.py quantize``.
+    """
+    if name == 'rasa':
+        registry.loader = None
+    elif name == 'numpy':
+        import rasa_numpy
+        registry.loader = rasa_numpy.NumpyIntentClassifier.load
+    elif name == 'int8':
+        import rasa_numpy
+        registry.loader = rasa_numpy.QuantizedIntentClassifier.load
+    else:
+        raise ValueError('unknown engine %r' % name)
+    registry.unload()
+
+
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+NUMBER_PATTERN = re.compile(r'\b[0-9]+\b')
+
+
+def tokenize(text, token_pattern=TOKEN_PATTERN, lowercase=True, replace_numbers=True):
+    """Returns the tokens of ``text`` in order, split the way
+    ``intent_featurizer_count_vectors`` does it."""
+    if lowercase:
+        text = text.lower()
+    if replace_numbers:
+        text = NUMBER_PATTERN.sub('__NUMBER__', text)
+    return token_pattern.findall(text)
+
+
+def normalize(text):
+    """Returns the bag of tokens that ``intent_featurizer_count_vectors`` sees.
+
+    Messages with the same bag get the same features, so they always
+    get the same parse.
+    """
+    return tuple(sorted(tokenize(text)))
+
+
+class ResultCache:
+    """LRU cache of parse results keyed by :func:`normalize`.
+
+    The cache is bounded by ``max_entries`` and, optionally, by the
+    approximate size of the stored results in ``max_bytes``. Entries
+    older than ``ttl`` seconds are treated as misses when ``ttl`` is
+    set. Everything is dropped when the ``trained_at`` stamp of
+    ``model_dir`` changes.
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=None, ttl=None, model_dir=MODEL_DIR):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.model_dir = model_dir
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stamp = ModelStamp(model_dir)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_model(self):
+        first = self._stamp.trained_at is None
+        if self._stamp.changed():
+            if not first:
+                self.invalidations += 1
+            self._clear()
+
+    @staticmethod
+    def _sizeof(key, result):
+        return sum(sys.getsizeof(token) for token in key) + len(repr(result))
+
+    def lookup(self, text):
+        """Returns the cached parse for ``text`` or ``None``."""
+        if not text:
+            return None
+
+        key = normalize(text)
+        with self._lock:
+            self._check_model()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            result, size, stored = entry
+            if self.ttl is not None and time.monotonic() - stored > self.ttl:
+                del self._entries[key]
+                self.size -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # callers get their own copy, changing it must not change the cache
+        result = copy.deepcopy(result)
+        result['text'] = text
+        return result
+
+    def store(self, text, result):
+        if not text:
+            return
+
+        key = normalize(text)
+        # the caller keeps its result, so the cache holds a copy
+        result = copy.deepcopy(result)
+        size = self._sizeof(key, result) if self.max_bytes is not None else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (result, size, time.monotonic())
+            self.size += size
+
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self.size -= size
+                self.evictions += 1
+
+    def get_or_parse(self, text, parse):
+        result = self.lookup(text)
+        if result is None:
+            result = parse(text)
+            self.store(text, result)
+        return result
+
+    def _clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+cache = ResultCache()
+
+_cascade = None
+_cascade_stamp = ModelStamp()
+
+
+def get_cascade():
+    """Returns the keyword fast path for the current model.
+
+    It is built from the model's own training data and rebuilt when the
+    model is retrained.
+    """
+    global _cascade
+    if _cascade_stamp.changed() or _cascade is None:
+        training_data = os.path.join(MODEL_DIR, 'training_data.json')
+        if not os.path.exists(training_data):
+            training_data = DATASET
+        _cascade = KeywordCascade.from_files(training_data, ABUSE_LEXICON)
+    return _cascade
+
+
+def fast_path(text):
+    """Returns a keyword fast-path parse for ``text``, or ``None``."""
+    return get_cascade().parse(text)
+
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """Records classifier stages on ``tracer``, a ``discord.tracing.Tracer``.
+
+    ``rasa.queue`` is the time a request waits for an executor thread and
+    ``rasa.model`` the router, model or process pool call for the
+    messages that missed the fast path and the cache.
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def _span(stage):
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(stage)
+
+
+_pool = None
+
+
+def enable_pool(workers=None, **options):
+    """Serves model parses from a ``rasa_pool.NLUPool`` of worker processes.
+
+    The workers run the NumPy export, memory-mapped once and shared
+    between them. The shared executor is resized to one thread per
+    worker so they all get requests. Returns the pool.
+    """
+    import rasa_pool
+
+    global _pool, _executor
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = rasa_pool.NLUPool(workers, **options)
+    if _executor is not None:
+        # finishes what is queued; get_executor() starts a bigger one
+        _executor.shutdown(wait=False)
+        _executor = None
+    return _pool
+
+
+def parse_one(text):
+    """Parses ``text`` with the process pool if one is enabled, else in process."""
+    if _pool is not None:
+        return _pool.parse(text)
+    # the interpreter is loaded on first use and kept for later messages
+    return registry.parse(text)
+
+
+_router = None
+_router_options = None
+_router_stamp = ModelStamp()
+
+
+def enable_routing(**options):
+    """Puts a cheap centroid model in front of the embedding classifier.
+
+    Messages only reach the embedding classifier when the centroid
+    model's confidence is below the calibrated threshold for the intent
+    it picked. ``options`` go to ``rasa_router.ModelRouter.from_dataset``.
+    Returns the router so its stats can be read.
+    """
+    import rasa_router
+
+    global _router, _router_options
+    _router_options = options
+    _router = rasa_router.ModelRouter.from_dataset(parse_one, parse_batch, **options)
+    _router_stamp.changed()
+    cache.clear()
+    return _router
+
+
+def get_router():
+    """Returns the router, or ``None`` when routing is off.
+
+    The centroid tier is rebuilt from the dataset when the model is
+    retrained, keeping the router's counters.
+    """
+    global _router
+    if _router is not None and _router_stamp.changed():
+        import rasa_router
+
+        router = rasa_router.ModelRouter.from_dataset(parse_one, parse_batch, **_router_options)
+        router.answered, router.escalated = _router.answered, _router.escalated
+        _router = router
+    return _router
+
+
+def model_parse(text):
+    """Parses ``text`` with the router if routing is enabled, else the model."""
+    router = get_router()
+    if router is not None:
+        return router.parse(text)
+    return parse_one(text)
+
+
 def call_for(message):
-    # from datetime import datetime
-    # s = datetime.now()
-    from rasa_nlu.model import Interpreter
-    interpreter = Interpreter.load('rasa_nlu_api/default/model')
-    # from random import choice
-    # from json import loads
-    import spacy
-    nlp = spacy.load('./en')
-    parsed_sentence = interpreter.parse(message)
-    return parsed_sentence
-    # print(datetime.now()-s)
-# print(call_for('fuck off')['intent']['name'])
\ No newline at end of file
+    result = fast_path(message)
+    if result is not None:
+        return result
+    return cache.get_or_parse(message, model_parse)
+# print(call_for('fuck off')['intent']['name'])
+
+
+def call_for_batch(texts):
+    """Batched :func:`call_for`, only parsing the texts that miss the cache."""
+    results = [fast_path(text) or cache.lookup(text) for text in texts]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        parsed = parse_missed_batch([texts[i] for i in missing])
+        for i, result in zip(missing, parsed):
+            results[i] = result
+    return results
+
+
+def parse_missed(text):
+    """:func:`call_for` for a message that already missed the fast path and cache.
+
+    Neither is checked again, so every message counts once in their
+    stats.
+    """
+    with _span('rasa.model'):
+        result = model_parse(text)
+    cache.store(text, result)
+    return result
+
+
+def parse_missed_batch(texts):
+    """Batched :func:`parse_missed`."""
+    router = get_router()
+    batch = router.parse_batch if router is not None else parse_batch
+    with _span('rasa.model'):
+        results = batch(texts)
+    for text, result in zip(texts, results):
+        cache.store(text, result)
+    return results
+
+
+INTENT_RANKING_LENGTH = 10
+
+
+def rank_intents(text, sims, inv_intent_dict, similarity_type='cosine'):
+    """Builds an ``Interpreter.parse`` style result from one row of similarities."""
+    sims = sims.copy()
+    if similarity_type == 'cosine':
+        # cosine similarity is clipped the same way the classifier does it
+        sims[sims < 0] = 0.0
+    order = sims.argsort()[::-1]
+    ranking = [{'name': inv_intent_dict[int(i)], 'confidence': float(sims[i])}
+               for i in order[:INTENT_RANKING_LENGTH]]
+    return {
+        'intent': ranking[0] if ranking else {'name': None, 'confidence': 0.0},
+        'entities': [],
+        'intent_ranking': ranking,
+        'text': text,
+    }
+
+
+def _empty_parse(text):
+    return {'intent': {'name': None, 'confidence': 0.0}, 'entities': [], 'text': text}
+
+
+_array_featurizers = weakref.WeakKeyDictionary()
+
+
+def _array_featurizer(component):
+    """Returns an :class:`rasa_numpy.ArrayFeaturizer` for a loaded count-vectors component."""
+    featurizer = _array_featurizers.get(component)
+    if featurizer is None:
+        import rasa_numpy
+        featurizer = _array_featurizers[component] = rasa_numpy.ArrayFeaturizer.from_component(component)
+    return featurizer
+
+
+def parse_batch(texts, model_dir=MODEL_DIR):
+    """Parses several messages with one featurizer call and one session run.
+
+    The results match what ``Interpreter.parse`` returns for each text.
+    """
+    if _pool is not None and model_dir == MODEL_DIR:
+        return _pool.parse_batch(texts)
+
+    interpreter = registry.get(model_dir)
+    if hasattr(interpreter, 'parse_batch'):
+        return interpreter.parse_batch(texts)
+
+    components = {c.name: c for c in interpreter.pipeline}
+    featurizer = components['intent_featurizer_count_vectors']
+    classifier = components['intent_classifier_tensorflow_embedding']
+
+    results = [None] * len(texts)
+    indices = [i for i, text in enumerate(texts) if text]
+    for i, text in enumerate(texts):
+        if not text:
+            results[i] = _empty_parse('')
+
+    if indices:
+        X = _array_featurizer(featurizer).transform_dense([texts[i] for i in indices])
+        all_Y = classifier._create_all_Y(X.shape[0])
+        sims = classifier.session.run(classifier.sim_op,
+                                      feed_dict={classifier.a_in: X, classifier.b_in: all_Y})
+        for row, i in zip(sims, indices):
+            results[i] = rank_intents(texts[i], row, classifier.inv_intent_dict,
+                                      classifier.similarity_type)
+    return results
+
+
+def percentile(values, q):
+    """Returns the ``q``-th percentile (0-100) of ``values`` by nearest rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(q / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class ClassifierBusy(Exception):
+    """Raised when a message cannot be queued for classification.
+
+    The executor raises this when its queue is full, or sets it on a
+    pending request that was shed to make room for a newer one.
+    """
+
+
+class NLUExecutor:
+    """Runs intent classification off the event loop.
+
+    Requests go into a bounded queue that a fixed set of worker threads
+    drains. When the queue is full, the ``policy`` decides what happens:
+    ``'reject'`` refuses the new message and ``'shed'`` drops the oldest
+    pending one instead. Either way the caller sees :exc:`ClassifierBusy`.
+
+    Cancelling the awaiting coroutine (or hitting its timeout) cancels
+    the request, and a worker skips it if it has not started yet.
+    """
+
+    def __init__(self, func=call_for, *, workers=1, max_pending=64, policy='reject'):
+        if policy not in ('reject', 'shed'):
+            raise ValueError('policy must be "reject" or "shed"')
+
+        self.func = func
+        self.max_pending = max_pending
+        self.policy = policy
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.shed = 0
+        self.cancelled = 0
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name='nlu-worker-%d' % i, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                future, text, queued = self._pending.popleft()
+
+            if _tracer is not None and _tracer.enabled:
+                _tracer.record('rasa.queue', time.perf_counter() - queued)
+
+            if not future.set_running_or_notify_cancel():
+                with self._cond:
+                    self.cancelled += 1
+                continue
+
+            try:
+                result = self.func(text)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._cond:
+                self.completed += 1
+
+    def submit(self, text):
+        """Queues ``text`` and returns a :class:`concurrent.futures.Future`."""
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('executor has been shut down')
+
+            if len(self._pending) >= self.max_pending:
+                if self.policy == 'reject':
+                    self.rejected += 1
+                    raise ClassifierBusy('%d messages already pending' % len(self._pending))
+
+                old, _, _ = self._pending.popleft()
+                if old.set_running_or_notify_cancel():
+                    old.set_exception(ClassifierBusy('dropped for a newer message'))
+                self.shed += 1
+
+            self._pending.append((future, text, time.perf_counter()))
+            self.submitted += 1
+            self._cond.notify()
+        return future
+
+    async def classify(self, text, *, timeout=None, loop=None):
+        """Classifies ``text`` without blocking the event loop."""
+        future = asyncio.wrap_future(self.submit(text), loop=loop)
+        if timeout is None:
+            return await future
+        return await asyncio.wait_for(future, timeout)
+
+    def shutdown(self, wait=True):
+        """Stops the workers once the already queued messages are done."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'shed': self.shed,
+            'cancelled': self.cancelled,
+        }
+
+
+_executor = None
+
+
+def get_executor():
+    """Returns the shared :class:`NLUExecutor`, creating it on first use.
+
+    It has one thread, or one per worker when a process pool is enabled.
+    """
+    global _executor
+    if _executor is None:
+        # classify() already tried the fast path and the cache
+        _executor = NLUExecutor(parse_missed, workers=_pool.size if _pool is not None else 1)
+    return _executor
+
+
+class MicroBatcher:
+    """Coalesces concurrent messages into batched model calls.
+
+    Messages that arrive within ``window`` seconds of each other, up to
+    ``max_batch`` of them, are handed to ``batch_fn`` as one list and
+    the results are fanned back out to each awaiting caller. Batches run
+    on an :class:`NLUExecutor` with ``workers`` threads, so its queue
+    bound and backpressure policy apply per batch.
+
+    :meth:`stats` reports throughput and how long messages waited for
+    their batch to be dispatched, which is the latency batching adds.
+    """
+
+    def __init__(self, batch_fn=call_for_batch, *, max_batch=32, window=0.005,
+                 executor=None, workers=1, loop=None, samples=1024):
+        self.max_batch = max_batch
+        self.window = window
+        self.loop = loop
+        self._executor = executor or NLUExecutor(batch_fn, workers=workers, max_pending=8)
+        self._batch = []
+        self._timer = None
+        self._waits = collections.deque(maxlen=samples)
+        self._latencies = collections.deque(maxlen=samples)
+        self.batches = 0
+        self.messages = 0
+        self.busy_time = 0.0
+        self._started = None
+
+    async def classify(self, text):
+        loop = self.loop or asyncio.get_event_loop()
+        future = loop.create_future()
+        now = time.perf_counter()
+        if self._started is None:
+            self._started = now
+
+        self._batch.append((text, future, now))
+        if len(self._batch) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = [entry for entry in self._batch if not entry[1].done()]
+        self._batch = []
+        if not batch:
+            return
+
+        dispatched = time.perf_counter()
+        for _, _, queued in batch:
+            self._waits.append(dispatched - queued)
+
+        try:
+            future = self._executor.submit([text for text, _, _ in batch])
+        except (ClassifierBusy, RuntimeError) as e:
+            # a full queue, or an executor that was shut down; either
+            # way nobody will answer these waiters
+            for _, waiter, _ in batch:
+                waiter.set_exception(e)
+            return
+
+        loop = self.loop or asyncio.get_event_loop()
+        future = asyncio.wrap_future(future, loop=loop)
+        future.add_done_callback(functools.partial(self._fan_out, batch, dispatched))
+
+    def _fan_out(self, batch, dispatched, future):
+        done = time.perf_counter()
+        self.busy_time += done - dispatched
+        self.batches += 1
+        self.messages += len(batch)
+
+        exc = None if future.cancelled() else future.exception()
+        results = None if exc is not None or future.cancelled() else future.result()
+        for index, (_, waiter, queued) in enumerate(batch):
+            self._latencies.append(done - queued)
+            if waiter.done():
+                continue
+            if results is not None:
+                waiter.set_result(results[index])
+            elif exc is not None:
+                waiter.set_exception(exc)
+            else:
+                waiter.cancel()
+
+    def stats(self):
+        """Returns throughput, batch size and added latency figures."""
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        waits = list(self._waits)
+        latencies = list(self._latencies)
+        return {
+            'batches': self.batches,
+            'messages': self.messages,
+            'mean_batch_size': self.messages / self.batches if self.batches else 0.0,
+            'messages_per_sec': self.messages / elapsed if elapsed else 0.0,
+            'model_messages_per_sec': self.messages / self.busy_time if self.busy_time else 0.0,
+            'batch_wait_p50': percentile(waits, 50),
+            'batch_wait_p99': percentile(waits, 99),
+            'latency_p50': percentile(latencies, 50),
+            'latency_p99': percentile(latencies, 99),
+        }
+
+
+_batcher = None
+
+
+def enable_batching(**options):
+    """Routes :func:`classify` through a :class:`MicroBatcher`.
+
+    ``options`` are passed to the batcher; with a process pool enabled,
+    batches run on one thread per worker. Returns the batcher so its
+    stats can be read.
+    """
+    global _batcher
+    options.setdefault('batch_fn', parse_missed_batch)
+    if _pool is not None:
+        options.setdefault('workers', _pool.size)
+    _batcher = MicroBatcher(**options)
+    return _batcher
+
+
+async def classify(text, *, timeout=None):
+    """Async version of :func:`call_for` that is safe to await from ``on_message``."""
+    # fast-path and cache hits are answered on the loop without a trip
+    # to the executor
+    result = fast_path(text) or cache.lookup(text)
+    if result is not None:
+        return result
+    if _batcher is not None:
+        if timeout is None:
+            return await _batcher.classify(text)
+        return await asyncio.wait_for(_batcher.classify(text), timeout)
+    return await get_executor().classify(text, timeout=timeout)
+
+
+def warm_up(model_dir=MODEL_DIR, dataset=DATASET):
+    """Loads the model and runs one parse per intent before any message arrives.
+
+    The parses go straight to the model, so neither the cache nor the
+    router counters see them. Returns the seconds spent per stage.
+    """
+    timings = collections.OrderedDict()
+
+    start = time.perf_counter()
+    if _pool is None:
+        registry.preload(model_dir)
+    timings['model'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_cascade()
+    get_executor()
+    timings['fast_path'] = time.perf_counter() - start
+
+    samples = list(collections.OrderedDict((intent, text) for text, intent in load_examples(dataset)).values())
+    start = time.perf_counter()
+    for text in samples:
+        parse_one(text)
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parse_batch(samples, model_dir)
+    timings['parse_batch'] = time.perf_counter() - start
+    return timings
+
+
+# at the end, the engines import names from this module
+set_engine(os.environ.get('RASA_ENGINE', 'rasa'))
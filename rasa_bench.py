@@ -0,0 +1,259 @@
+"""Latency and throughput benchmark for intent classification.
+
+Replays the ``dataset.json`` utterances, followed by a synthetic mix where
+``--repeat-ratio`` of the messages are repeats of a small hot set and the
+rest are new recombinations of training words. Messages go through any
+callable that takes a message and returns a parse, given as
+``module:attribute``. The default, ``rasa_api:model_parse``, is the model
+itself; ``rasa_api:call_for`` adds the keyword fast path and the result
+cache in front of it, which answer every dataset utterance without the
+model.
+
+It reports:
+
+* cold start: importing the engine and answering a first message that
+  neither the fast path nor the cache can answer, in a fresh interpreter;
+* p50/p95/p99 latency of single messages;
+* messages per second with 1..N threads calling the engine at once;
+* the fast-path and cache hit rate of every phase;
+* peak RSS of the benchmark process.
+
+The cache is cleared before every phase, and each phase gets its own
+messages: apart from the hot set, no message is sent twice in a run.
+
+``--out`` writes the results as JSON, tagged with the current git commit.
+``--compare`` prints how a run differs from an earlier results file::
+
+    $ python rasa_bench.py --out bench-before.json
+    $ python rasa_bench.py --compare bench-before.json
+"""
+import argparse
+import concurrent.futures
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import rasa_api
+from rasa_api import DATASET, load_examples, percentile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+ENGINE = 'rasa_api:model_parse'
+
+# made of words that are not in the training data, so the first parse
+# reaches the model and the cold start includes loading it
+COLD_START_TEXT = 'qzx benchmark warmup probe'
+
+
+def load_engine(spec):
+    module, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module), attribute or 'call_for')
+
+
+def synthetic_messages(examples, count, repeat_ratio=0.5, hot_set=10, seed=0, seen=None):
+    """Returns ``count`` messages, ``repeat_ratio`` of them drawn from a hot set.
+
+    The others are unique and are added to ``seen``; pass the same set
+    to later calls to keep their messages unique too. Training texts are
+    never generated.
+    """
+    rng = random.Random(seed)
+    texts = [text for text, _ in examples]
+    hot = rng.sample(texts, min(hot_set, len(texts)))
+    words = sorted({word for text in texts for word in text.split()})
+    if seen is None:
+        seen = set()
+    seen.update(texts)
+
+    messages = []
+    for _ in range(count):
+        if rng.random() < repeat_ratio:
+            messages.append(rng.choice(hot))
+            continue
+        message = None
+        while message is None or message in seen:
+            message = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 8)))
+        seen.add(message)
+        messages.append(message)
+    return messages
+
+
+def _hit_counters():
+    cascade = rasa_api._cascade
+    return {
+        'fast_path': cascade.stats()['short_circuited'] if cascade is not None else 0,
+        'cache': rasa_api.cache.hits,
+    }
+
+
+def _phase(hit_rates, name, measure, engine, messages, *args):
+    """Runs ``measure`` on a cleared cache and records the phase's hit rates."""
+    rasa_api.cache.clear()
+    before = _hit_counters()
+    result = measure(engine, messages, *args)
+    after = _hit_counters()
+    hit_rates[name] = {key + '_rate': (after[key] - before[key]) / len(messages) for key in after}
+    return result
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+# run with -c rather than through this file, which imports rasa_api
+# before the clock starts
+_COLD_START = """
+import importlib, json, sys, time
+start = time.perf_counter()
+module, _, attribute = sys.argv[1].partition(':')
+engine = getattr(importlib.import_module(module), attribute or 'call_for')
+imported = time.perf_counter()
+engine(sys.argv[2])
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first_parse': done - imported, 'total': done - start}))
+"""
+
+
+def cold_start(spec):
+    """Measures import plus first parse of ``spec`` in a fresh interpreter."""
+    output = subprocess.check_output([sys.executable, '-c', _COLD_START, spec, COLD_START_TEXT],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def measure_latency(engine, messages):
+    latencies = []
+    for message in messages:
+        start = time.perf_counter()
+        engine(message)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+    }
+
+
+def measure_throughput(engine, messages, concurrency):
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(engine, messages))
+        elapsed = time.perf_counter() - start
+    return len(messages) / elapsed
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8').strip()
+
+
+def run(spec=ENGINE, dataset=DATASET, count=2000, repeat_ratio=0.5,
+        max_concurrency=8, seed=0):
+    examples = load_examples(dataset)
+    replay = [text for text, _ in examples]
+    seen = set()
+    mix = synthetic_messages(examples, count, repeat_ratio, seed=seed, seen=seen)
+
+    results = {
+        'engine': spec,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'messages': {'replay': len(replay), 'synthetic': len(mix), 'repeat_ratio': repeat_ratio},
+        'cold_start': cold_start(spec),
+    }
+
+    engine = load_engine(spec)
+    engine(COLD_START_TEXT)
+    hit_rates = results['hit_rates'] = {}
+    results['latency'] = {
+        'replay': _phase(hit_rates, 'replay', measure_latency, engine, replay),
+        'synthetic': _phase(hit_rates, 'synthetic', measure_latency, engine, mix),
+    }
+
+    levels = []
+    level = 1
+    while level <= max_concurrency:
+        levels.append(level)
+        level *= 2
+    results['throughput'] = {}
+    for n in levels:
+        messages = synthetic_messages(examples, count, repeat_ratio, seed=seed + n, seen=seen)
+        results['throughput'][str(n)] = _phase(hit_rates, 'throughput_%d' % n, measure_throughput,
+                                               engine, messages, n)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def _flatten(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + key + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def compare(old, new):
+    """Prints every numeric metric of ``new`` next to ``old`` with the change."""
+    before = dict(_flatten(old))
+    for key, value in _flatten(new):
+        if key in before and before[key]:
+            print('%-40s %12.3f %12.3f %+8.1f%%' % (key, before[key], value,
+                                                   100.0 * (value - before[key]) / before[key]))
+
+
+def report(results):
+    cold = results['cold_start']
+    print('engine: %s (commit %s)' % (results['engine'], results['commit']))
+    print('cold start: %.3fs (import %.3fs, first parse %.3fs)' % (
+        cold['total'], cold['import'], cold['first_parse']))
+    for name, latency in sorted(results['latency'].items()):
+        print('%-10s p50 %.3fms  p95 %.3fms  p99 %.3fms' % (
+            name, latency['p50_ms'], latency['p95_ms'], latency['p99_ms']))
+    for level, rate in sorted(results['throughput'].items(), key=lambda item: int(item[0])):
+        print('concurrency %-3s %10.1f msg/s' % (level, rate))
+    for name, rates in results['hit_rates'].items():
+        print('%-14s fast path %5.1f%%  cache %5.1f%%' % (
+            name, 100 * rates['fast_path_rate'], 100 * rates['cache_rate']))
+    if results['peak_rss_mb'] is not None:
+        print('peak RSS: %.1f MB' % results['peak_rss_mb'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--engine', default=ENGINE, help='module:callable to benchmark')
+    parser.add_argument('--dataset', default=DATASET)
+    parser.add_argument('--messages', type=int, default=2000, help='size of the synthetic mix')
+    parser.add_argument('--repeat-ratio', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=8, help='highest thread count to try')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results as JSON to this path')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    results = run(args.engine, args.dataset, args.messages, args.repeat_ratio, args.concurrency, args.seed)
+    report(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fp:
+            compare(json.load(fp), results)
@@ -0,0 +1,132 @@
+"""Compiled training data.
+
+``dataset.json`` is cached in a flat binary file next to it
+(``dataset.bin``) in the memory-mappable layout of :mod:`rasa_pack`, so
+reading the examples skips the JSON parse. Examples are deduplicated,
+texts are stored as one UTF-8 buffer and intents as integer ids. Rasa
+still tokenizes and featurizes the texts itself when training.
+
+The file records a hash of the JSON it was built from. :func:`load`
+recompiles whenever the JSON changed, so callers never see stale data.
+When the file can't be written, for example on a read-only deploy, the
+JSON is compiled in memory instead. To build the file by hand::
+
+    $ python rasa_dataset.py
+"""
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from rasa_api import DATASET, load_examples
+from rasa_pack import map_pack, write_pack
+
+FORMAT_VERSION = 2
+
+
+def compiled_path(dataset=DATASET):
+    return os.path.splitext(dataset)[0] + '.bin'
+
+
+def source_hash(dataset=DATASET):
+    digest = hashlib.sha1(('%d:' % FORMAT_VERSION).encode('utf-8'))
+    with open(dataset, 'rb') as fp:
+        digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def compile_arrays(dataset=DATASET):
+    """Returns the arrays of the compiled form of ``dataset``."""
+    examples = list(dict.fromkeys(load_examples(dataset, compiled=False)))
+    intent_names = sorted({intent for _, intent in examples})
+    intent_ids = {name: i for i, name in enumerate(intent_names)}
+
+    encoded = [text.encode('utf-8') for text, _ in examples]
+    return {
+        'source_hash': np.array(source_hash(dataset)),
+        'text_data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'text_offsets': np.cumsum([0] + [len(text) for text in encoded], dtype=np.int64),
+        'intent_ids': np.array([intent_ids[intent] for _, intent in examples], dtype=np.int32),
+        'intent_names': np.array(intent_names, dtype=str),
+    }
+
+
+def compile_dataset(dataset=DATASET, path=None):
+    """Compiles ``dataset`` and returns the path of the binary file."""
+    path = path or compiled_path(dataset)
+    write_pack(compile_arrays(dataset), path)
+    return path
+
+
+class CompiledDataset:
+    """Read-only view of a compiled dataset file."""
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.source_hash = str(arrays['source_hash'])
+        self.intent_names = arrays['intent_names']
+        self.intent_ids = arrays['intent_ids']
+        self._text_data = arrays['text_data']
+        self._text_offsets = arrays['text_offsets']
+
+    @classmethod
+    def open(cls, path):
+        return cls(map_pack(path))
+
+    def __len__(self):
+        return len(self.intent_ids)
+
+    def text(self, index):
+        start, end = self._text_offsets[index], self._text_offsets[index + 1]
+        return self._text_data[start:end].tobytes().decode('utf-8')
+
+    def intent(self, index):
+        return str(self.intent_names[self.intent_ids[index]])
+
+    def examples(self):
+        """Returns ``(text, intent)`` pairs, like :func:`rasa_api.load_examples`."""
+        return [(self.text(i), self.intent(i)) for i in range(len(self))]
+
+    def training_data(self):
+        """Returns the examples as a rasa_nlu ``TrainingData``."""
+        from rasa_nlu.training_data import Message, TrainingData
+
+        return TrainingData([Message(text, {'intent': intent, 'entities': []})
+                             for text, intent in self.examples()])
+
+
+def load(dataset=DATASET, path=None):
+    """Maps the compiled form of ``dataset``, compiling it first if it is missing or stale."""
+    path = path or compiled_path(dataset)
+    if os.path.exists(path):
+        compiled = CompiledDataset.open(path)
+        if compiled.source_hash == source_hash(dataset):
+            return compiled
+    try:
+        return CompiledDataset.open(compile_dataset(dataset, path))
+    except OSError:
+        # can't write next to the dataset; importing the bot must not
+        # depend on that
+        return CompiledDataset(compile_arrays(dataset))
+
+
+if __name__ == '__main__':
+    dataset = sys.argv[1] if len(sys.argv) > 1 else DATASET
+    start = time.perf_counter()
+    path = compile_dataset(dataset)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_examples(dataset, compiled=False)
+    json_time = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled = load(dataset, path)
+    compiled.examples()
+    load_time = time.perf_counter() - start
+
+    print('wrote %s: %d examples, %d intents, %d bytes' % (
+        path, len(compiled), len(compiled.intent_names), os.path.getsize(path)))
+    print('compile %.2fms, JSON load %.2fms, compiled load %.2fms' % (
+        1000 * compile_time, 1000 * json_time, 1000 * load_time))
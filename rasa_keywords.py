@@ -0,0 +1,175 @@
+"""Keyword fast path that runs before the intent model.
+
+:class:`KeywordMatcher` is an Aho-Corasick automaton over whole-word
+phrases, so a message is scanned once no matter how many phrases there
+are. :class:`KeywordCascade` builds one from the training examples and the
+abuse lexicon, and answers the messages it is certain about:
+
+* a message made up entirely of lexicon terms is ``abuse``;
+* a message made up entirely of training phrases of one intent is that
+  intent.
+
+A lexicon term inside a longer message ("moby dick book") is left to the
+model, which sees the rest of the message.
+
+Everything else returns ``None`` and goes on to the model.
+"""
+import collections
+import json
+import re
+
+NON_WORD = re.compile(r'(?u)[\W_]+')
+
+
+def normalize_phrase(text):
+    """Lowercases ``text`` and turns every run of non-word characters into one space."""
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton matching whole-word phrases.
+
+    ``patterns`` is an iterable of ``(phrase, value)`` pairs. Phrases are
+    matched against text that went through :func:`normalize_phrase`.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase, value in patterns:
+            phrase = normalize_phrase(phrase)
+            if phrase:
+                self._add(phrase, value)
+        self._build()
+
+    def _add(self, phrase, value):
+        state = 0
+        for char in phrase:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(phrase), value))
+
+    def _build(self):
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text):
+        """Yields ``(start, end, value)`` for every whole-word match in ``text``.
+
+        ``text`` must already be normalized.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        last = len(text) - 1
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state] and (index == last or text[index + 1] == ' '):
+                for length, value in out[state]:
+                    start = index - length + 1
+                    if start == 0 or text[start - 1] == ' ':
+                        yield start, index + 1, value
+
+
+def load_lexicon(path):
+    """Reads one term per line, skipping blank lines and ``#`` comments.
+
+    Returns ``(terms, excluded)``, where ``excluded`` are the terms given
+    on ``!`` lines.
+    """
+    terms, excluded = [], []
+    with open(path, encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('!'):
+                excluded.append(line[1:].strip())
+            else:
+                terms.append(line)
+    return terms, excluded
+
+
+class KeywordCascade:
+    """Decides high-certainty intents before the model runs.
+
+    Training phrases that appear under more than one intent are left out
+    so that a fast-path answer is never ambiguous, and so are the phrases
+    in ``excluded``. Lexicon terms count as phrases of ``abuse_intent``.
+    """
+
+    def __init__(self, examples, lexicon=(), abuse_intent='abuse', excluded=()):
+        intents = collections.defaultdict(set)
+        for text, intent in examples:
+            intents[normalize_phrase(text)].add(intent)
+
+        excluded = {normalize_phrase(phrase) for phrase in excluded}
+        patterns = [(phrase, names.pop()) for phrase, names in intents.items()
+                    if len(names) == 1 and phrase not in excluded]
+        patterns.extend((term, abuse_intent) for term in lexicon)
+        self.matcher = KeywordMatcher(patterns)
+        self.abuse_intent = abuse_intent
+        self.checked = 0
+        self.short_circuited = collections.Counter()
+
+    @classmethod
+    def from_files(cls, training_data, lexicon=None):
+        # training data is Rasa's JSON format, dataset.json carries a BOM
+        with open(training_data, encoding='utf-8-sig') as fp:
+            data = json.load(fp)
+        examples = [(e['text'], e['intent']) for e in data['rasa_nlu_data']['common_examples']]
+        terms, excluded = load_lexicon(lexicon) if lexicon else ((), ())
+        return cls(examples, terms, excluded=excluded)
+
+    def match(self, text):
+        """Returns the intent name for ``text`` or ``None`` to fall through."""
+        self.checked += 1
+        text = normalize_phrase(text)
+        if not text:
+            return None
+
+        covered = collections.defaultdict(list)
+        for start, end, intent in self.matcher.finditer(text):
+            covered[intent].append((start, end))
+
+        words = [m.span() for m in re.finditer(r'\S+', text)]
+        found = [intent for intent, spans in covered.items()
+                 if all(any(s <= start and end <= e for s, e in spans) for start, end in words)]
+        if len(found) != 1:
+            return None
+
+        self.short_circuited[found[0]] += 1
+        return found[0]
+
+    def parse(self, text):
+        """Like :meth:`match` but returns an ``Interpreter.parse`` style dict."""
+        intent = self.match(text)
+        if intent is None:
+            return None
+        ranking = [{'name': intent, 'confidence': 1.0}]
+        return {'intent': ranking[0], 'entities': [], 'intent_ranking': ranking, 'text': text}
+
+    def stats(self):
+        total = sum(self.short_circuited.values())
+        return {
+            'checked': self.checked,
+            'short_circuited': total,
+            'short_circuit_rate': total / self.checked if self.checked else 0.0,
+            'by_intent': dict(self.short_circuited),
+        }
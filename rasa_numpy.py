@@ -0,0 +1,448 @@
+"""TensorFlow-free inference for the embedding intent model.
+
+``python rasa_numpy.py export`` reads the count-vectorizer vocabulary and
+the ``intent_classifier_tensorflow_embedding`` checkpoint from a trained
+model directory and writes them to one ``.npz`` file. Exporting needs
+rasa_nlu and TensorFlow. :class:`NumpyIntentClassifier` only needs NumPy
+to load that file and gives the same intent ranking as the interpreter.
+
+``python rasa_numpy.py parity`` runs both engines over ``dataset.json``
+and reports every example where the ranking differs.
+
+``python rasa_numpy.py quantize`` converts the export to int8 weights with
+one scale per row, for :class:`QuantizedIntentClassifier`, and prints its
+accuracy, weight size and latency next to the float model's.
+"""
+import json
+import os
+import pickle
+import re
+import sys
+import time
+
+import numpy as np
+
+from rasa_api import MODEL_DIR, DATASET, load_examples, percentile, rank_intents, read_trained_at, tokenize
+
+EXPORT_FILE = 'intent_classifier_numpy.npz'
+QUANTIZED_FILE = 'intent_classifier_int8.npz'
+CHECKPOINT = 'intent_classifier_tensorflow_embedding.ckpt'
+ENCODED_INTENTS = 'intent_classifier_tensorflow_embedding_encoded_all_intents.pkl'
+INV_INTENT_DICT = 'intent_classifier_tensorflow_embedding_inv_intent_dict.pkl'
+FEATURIZER = 'intent_featurizer_count_vectors.pkl'
+
+
+def _dense_layers(reader, prefix):
+    layers = []
+    index = 0
+    while reader.has_tensor('%s_%d/kernel' % (prefix, index)):
+        name = '%s_%d' % (prefix, index)
+        layers.append((reader.get_tensor(name + '/kernel'), reader.get_tensor(name + '/bias')))
+        index += 1
+    return layers
+
+
+def _forward(x, hidden, embed):
+    for kernel, bias in hidden:
+        x = np.maximum(x.dot(kernel) + bias, 0.0)
+    kernel, bias = embed
+    return x.dot(kernel) + bias
+
+
+def l2_normalize(x, axis=-1):
+    # same epsilon as tf.nn.l2_normalize
+    square_sum = np.sum(np.square(x), axis=axis, keepdims=True)
+    return x / np.sqrt(np.maximum(square_sum, 1e-12))
+
+
+def export(model_dir=MODEL_DIR, path=None):
+    """Writes the weights and vocabulary of ``model_dir`` to an ``.npz`` file.
+
+    Returns the path that was written.
+    """
+    import tensorflow as tf
+
+    with open(os.path.join(model_dir, FEATURIZER), 'rb') as fp:
+        featurizer = pickle.load(fp)
+    with open(os.path.join(model_dir, ENCODED_INTENTS), 'rb') as fp:
+        encoded_all_intents = pickle.load(fp)
+    with open(os.path.join(model_dir, INV_INTENT_DICT), 'rb') as fp:
+        inv_intent_dict = pickle.load(fp)
+
+    config = featurizer.component_config
+    vocabulary = featurizer.vect.vocabulary_
+    words = sorted(vocabulary, key=vocabulary.__getitem__)
+
+    reader = tf.train.NewCheckpointReader(os.path.join(model_dir, CHECKPOINT))
+    hidden_a = _dense_layers(reader, 'hidden_layer_a')
+    hidden_b = _dense_layers(reader, 'hidden_layer_b')
+    embed_a = (reader.get_tensor('embed_layer_a/kernel'), reader.get_tensor('embed_layer_a/bias'))
+    embed_b = (reader.get_tensor('embed_layer_b/kernel'), reader.get_tensor('embed_layer_b/bias'))
+
+    # the intent side of the network only ever sees the fixed intent
+    # encodings, so its output can be computed once here
+    intent_embed = _forward(encoded_all_intents.astype(np.float32), hidden_b, embed_b)
+
+    arrays = {
+        'vocabulary': np.array(words),
+        'intents': np.array([inv_intent_dict[i] for i in range(len(inv_intent_dict))]),
+        'intent_embed': intent_embed.astype(np.float32),
+        'num_hidden': np.array(len(hidden_a)),
+        'embed_kernel': embed_a[0],
+        'embed_bias': embed_a[1],
+        'similarity_type': np.array(_similarity_type(model_dir)),
+        'token_pattern': np.array(config['token_pattern']),
+        'lowercase': np.array(bool(config['lowercase'])),
+        # rasa's tokenizer override is what replaces bare numbers
+        'replace_numbers': np.array(featurizer.vect.tokenizer is not None),
+        'oov_token': np.array(config.get('OOV_token') or ''),
+        'trained_at': np.array(read_trained_at(model_dir)),
+    }
+    for index, (kernel, bias) in enumerate(hidden_a):
+        arrays['hidden_kernel_%d' % index] = kernel
+        arrays['hidden_bias_%d' % index] = bias
+
+    path = path or os.path.join(model_dir, EXPORT_FILE)
+    np.savez(path, **arrays)
+    return path
+
+
+def _similarity_type(model_dir):
+    with open(os.path.join(model_dir, 'metadata.json'), encoding='utf-8') as fp:
+        pipeline = json.load(fp)['pipeline']
+    for component in pipeline:
+        if component['name'] == 'intent_classifier_tensorflow_embedding':
+            return component['similarity_type']
+    raise ValueError('%s has no intent_classifier_tensorflow_embedding' % model_dir)
+
+
+class ArrayFeaturizer:
+    """Count-vector featurization over a sorted array of tokens.
+
+    Tokenization matches ``intent_featurizer_count_vectors``. All tokens
+    of a batch are looked up with one binary search over the sorted
+    vocabulary, which also works directly on a read-only (for example
+    memory mapped) array, so no token dict is ever built. ``ids[i]`` is
+    the feature id of ``words[i]``; without ``ids`` the position in
+    ``words`` is the id.
+    """
+
+    def __init__(self, words, ids=None, token_pattern=r'(?u)\b\w\w+\b', lowercase=True,
+                 replace_numbers=True, oov_token=None):
+        words = np.asarray(words)
+        if ids is None:
+            order = np.argsort(words, kind='mergesort')
+            if np.any(order != np.arange(len(words))):
+                words, ids = words[order], order
+        self.words = words
+        self.ids = None if ids is None else np.asarray(ids, dtype=np.int32)
+        self.token_pattern = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.replace_numbers = replace_numbers
+        self.oov_id = None
+        if oov_token:
+            oov = self.lookup([oov_token])[0]
+            self.oov_id = int(oov) if oov >= 0 else None
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Builds the featurizer of an export or pack file."""
+        return cls(arrays['vocabulary'], arrays['vocabulary_ids'] if 'vocabulary_ids' in arrays else None,
+                   str(arrays['token_pattern']), bool(arrays['lowercase']), bool(arrays['replace_numbers']),
+                   str(arrays['oov_token']))
+
+    @classmethod
+    def from_component(cls, featurizer):
+        """Builds the featurizer of a trained ``intent_featurizer_count_vectors``."""
+        vocabulary = featurizer.vect.vocabulary_
+        words = sorted(vocabulary)
+        config = featurizer.component_config
+        return cls(words, [vocabulary[word] for word in words], config['token_pattern'],
+                   bool(config['lowercase']), featurizer.vect.tokenizer is not None,
+                   config.get('OOV_token'))
+
+    def __len__(self):
+        return len(self.words)
+
+    def tokenize(self, text):
+        return tokenize(text, self.token_pattern, self.lowercase, self.replace_numbers)
+
+    def lookup(self, tokens):
+        """Returns the feature id of every token, or -1 for unknown ones."""
+        if not len(tokens) or not len(self.words):
+            return np.full(len(tokens), -1, dtype=np.int32)
+        tokens = np.asarray(tokens)
+        index = np.searchsorted(self.words, tokens)
+        np.minimum(index, len(self.words) - 1, out=index)
+        ids = index.astype(np.int32) if self.ids is None else self.ids[index]
+        ids[self.words[index] != tokens] = -1
+        return ids
+
+    def transform(self, texts):
+        """Returns ``(rows, ids)`` with one entry per known token of ``texts``.
+
+        A token that occurs twice in a text shows up twice, so counting
+        the ``(row, id)`` pairs gives the count vectors.
+        """
+        tokenized = [self.tokenize(text) for text in texts]
+        ids = self.lookup([token for tokens in tokenized for token in tokens])
+        rows = np.repeat(np.arange(len(texts), dtype=np.int32), [len(tokens) for tokens in tokenized])
+        if self.oov_id is not None:
+            ids[ids < 0] = self.oov_id
+            return rows, ids
+        known = ids >= 0
+        return rows[known], ids[known]
+
+    def transform_dense(self, texts):
+        """Returns the count matrix for ``texts``, like ``CountVectorizer.transform``."""
+        rows, ids = self.transform(texts)
+        size = len(self.words)
+        counts = np.bincount(rows.astype(np.int64) * size + ids, minlength=len(texts) * size)
+        return counts.reshape(len(texts), size).astype(np.float32)
+
+
+class NumpyIntentClassifier:
+    """Count-vector featurizer and embedding classifier in plain NumPy.
+
+    Use :meth:`load` on a model directory (or an ``.npz`` path) written by
+    :func:`export`. :meth:`parse` returns the same dict as
+    ``Interpreter.parse``.
+    """
+    export_file = EXPORT_FILE
+    export_command = 'export'
+
+    def __init__(self, arrays):
+        self.featurizer = ArrayFeaturizer.from_arrays(arrays)
+        self.intents = arrays['intents'].tolist()
+        self.inv_intent_dict = dict(enumerate(self.intents))
+        self.similarity_type = str(arrays['similarity_type'])
+        self.trained_at = str(arrays['trained_at'])
+        self._load_weights(arrays)
+
+    def _load_weights(self, arrays):
+        self.hidden = [(arrays['hidden_kernel_%d' % i], arrays['hidden_bias_%d' % i])
+                       for i in range(int(arrays['num_hidden']))]
+        self.embed = (arrays['embed_kernel'], arrays['embed_bias'])
+
+        intent_embed = arrays['intent_embed']
+        if self.similarity_type == 'cosine':
+            intent_embed = l2_normalize(intent_embed)
+        self.intent_embed = intent_embed
+
+    @classmethod
+    def load(cls, path=MODEL_DIR):
+        if os.path.isdir(path):
+            model_dir, path = path, os.path.join(path, cls.export_file)
+        else:
+            model_dir = os.path.dirname(path)
+
+        if not os.path.exists(path):
+            raise FileNotFoundError('%s not found, run "python rasa_numpy.py %s" first'
+                                    % (path, cls.export_command))
+
+        with np.load(path) as arrays:
+            self = cls(arrays)
+
+        if os.path.exists(os.path.join(model_dir, 'metadata.json')):
+            trained_at = read_trained_at(model_dir)
+            if trained_at != self.trained_at:
+                raise ValueError('%s was exported from the model trained at %s, '
+                                 'but the model was retrained at %s' % (path, self.trained_at, trained_at))
+        return self
+
+    def featurize(self, texts):
+        """Returns the bag-of-words count matrix for ``texts``."""
+        return self.featurizer.transform_dense(texts)
+
+    def similarities(self, X):
+        """Returns the message/intent similarity matrix for featurized messages."""
+        embed = _forward(X, self.hidden, self.embed)
+        if self.similarity_type == 'cosine':
+            embed = l2_normalize(embed)
+        return embed.dot(self.intent_embed.T)
+
+    def parse_batch(self, texts):
+        results = [None] * len(texts)
+        indices = [i for i, text in enumerate(texts) if text]
+        for i, text in enumerate(texts):
+            if not text:
+                results[i] = {'intent': {'name': None, 'confidence': 0.0}, 'entities': [], 'text': ''}
+
+        if indices:
+            sims = self.similarities(self.featurize([texts[i] for i in indices]))
+            for row, i in zip(sims, indices):
+                results[i] = rank_intents(texts[i], row, self.inv_intent_dict, self.similarity_type)
+        return results
+
+    def parse(self, text):
+        return self.parse_batch([text])[0]
+
+    def weight_bytes(self):
+        """Returns the size of the weight arrays held in memory."""
+        arrays = [self.intent_embed] + [a for layer in self.hidden + [self.embed] for a in layer]
+        return sum(a.nbytes for a in arrays)
+
+
+def quantize_rows(matrix):
+    """Symmetric int8 quantization of ``matrix`` with one scale per row.
+
+    Returns ``(values, scales)`` with ``matrix ~= values * scales[:, None]``.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    peak = np.max(np.abs(matrix), axis=1) if matrix.shape[1] else np.zeros(len(matrix), np.float32)
+    scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    values = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return values, scales
+
+
+def quantize(model_dir=MODEL_DIR, path=None):
+    """Writes an int8 copy of the NumPy export of ``model_dir``.
+
+    The input layer is quantized per vocabulary row, so featurization
+    only gathers the rows of the tokens in a message. The other layers
+    are stored transposed and quantized per output unit, and the intent
+    embeddings per intent, so every scale factors out of an integer dot
+    product. Returns the path that was written.
+    """
+    with np.load(os.path.join(model_dir, EXPORT_FILE)) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+
+    num_hidden = int(arrays['num_hidden'])
+    kernels = [arrays.pop('hidden_kernel_%d' % i) for i in range(num_hidden)] + [arrays.pop('embed_kernel')]
+    biases = [arrays.pop('hidden_bias_%d' % i) for i in range(num_hidden)] + [arrays.pop('embed_bias')]
+
+    arrays['input_kernel'], arrays['input_scales'] = quantize_rows(kernels[0])
+    arrays['input_bias'] = biases[0]
+    arrays['num_dense'] = np.array(len(kernels) - 1)
+    for index, (kernel, bias) in enumerate(zip(kernels[1:], biases[1:])):
+        arrays['dense_kernel_%d' % index], arrays['dense_scales_%d' % index] = quantize_rows(kernel.T)
+        arrays['dense_bias_%d' % index] = bias
+
+    intent_embed = arrays.pop('intent_embed')
+    if str(arrays['similarity_type']) == 'cosine':
+        intent_embed = l2_normalize(intent_embed)
+    arrays['intent_embed'], arrays['intent_scales'] = quantize_rows(intent_embed)
+
+    path = path or os.path.join(model_dir, QUANTIZED_FILE)
+    np.savez(path, **arrays)
+    return path
+
+
+def _int8_dot(x, values, scales):
+    """``x`` times the transpose of a row-quantized matrix, as an int8 dot product."""
+    peak = np.abs(x).max(axis=1, keepdims=True)
+    x_scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+    # NumPy has no BLAS path for integer matmul. Sums of up to 1040
+    # products of int8 values stay below 2**24, so float32 BLAS computes
+    # the same integers exactly and much faster.
+    x_values = np.rint(x / x_scales)
+    product = x_values.dot(values.T.astype(np.float32))
+    return product * x_scales * scales
+
+
+class QuantizedIntentClassifier(NumpyIntentClassifier):
+    """:class:`NumpyIntentClassifier` over the int8 weights written by :func:`quantize`.
+
+    Activations are quantized per message before each dense layer and
+    before the similarity, so every matrix product is an int8 dot product.
+    """
+    export_file = QUANTIZED_FILE
+    export_command = 'quantize'
+
+    def _load_weights(self, arrays):
+        self.input_layer = (arrays['input_kernel'], arrays['input_scales'], arrays['input_bias'])
+        self.dense = [(arrays['dense_kernel_%d' % i], arrays['dense_scales_%d' % i], arrays['dense_bias_%d' % i])
+                      for i in range(int(arrays['num_dense']))]
+        self.intent_embed = arrays['intent_embed']
+        self.intent_scales = arrays['intent_scales']
+
+    def similarities(self, X):
+        values, scales, bias = self.input_layer
+        # only the rows of tokens that occur in the batch are dequantized
+        used = np.flatnonzero(X.any(axis=0))
+        x = (X[:, used] * scales[used]).dot(values[used].astype(np.float32)) + bias
+
+        for values, scales, bias in self.dense:
+            x = _int8_dot(np.maximum(x, 0.0), values, scales) + bias
+
+        if self.similarity_type == 'cosine':
+            x = l2_normalize(x)
+        return _int8_dot(x, self.intent_embed, self.intent_scales)
+
+    def weight_bytes(self):
+        arrays = list(self.input_layer) + [a for layer in self.dense for a in layer]
+        return sum(a.nbytes for a in arrays + [self.intent_embed, self.intent_scales])
+
+
+def check_parity(model_dir=MODEL_DIR, dataset=DATASET, tolerance=1e-4):
+    """Compares the NumPy engine with the Rasa interpreter on ``dataset``.
+
+    Returns a list of ``(text, rasa_ranking, numpy_ranking)`` for every
+    example whose intent order differs or whose confidences differ by more
+    than ``tolerance``.
+    """
+    from rasa_nlu.model import Interpreter
+
+    interpreter = Interpreter.load(model_dir)
+    engine = NumpyIntentClassifier.load(model_dir)
+
+    mismatches = []
+    for text, _ in load_examples(dataset):
+        expected = interpreter.parse(text)['intent_ranking']
+        actual = engine.parse(text)['intent_ranking']
+        same_order = [r['name'] for r in expected] == [r['name'] for r in actual]
+        close = all(abs(e['confidence'] - a['confidence']) <= tolerance
+                    for e, a in zip(expected, actual))
+        if not (same_order and close):
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+
+def compare_quantized(model_dir=MODEL_DIR, dataset=DATASET):
+    """Runs the float and int8 engines over ``dataset`` and returns their numbers."""
+    examples = load_examples(dataset)
+    report = {}
+    predictions = {}
+    for name, cls in (('float32', NumpyIntentClassifier), ('int8', QuantizedIntentClassifier)):
+        engine = cls.load(model_dir)
+        engine.parse(examples[0][0])
+        results = []
+        latencies = []
+        for text, _ in examples:
+            start = time.perf_counter()
+            results.append(engine.parse(text)['intent'])
+            latencies.append(time.perf_counter() - start)
+        predictions[name] = results
+        report[name] = {
+            'accuracy': sum(r['name'] == intent for r, (_, intent) in zip(results, examples)) / len(examples),
+            'weight_bytes': engine.weight_bytes(),
+            'latency_p50_ms': 1000 * percentile(latencies, 50),
+        }
+
+    pairs = list(zip(predictions['float32'], predictions['int8']))
+    report['agreement'] = sum(a['name'] == b['name'] for a, b in pairs) / len(pairs)
+    report['max_confidence_delta'] = max(abs(a['confidence'] - b['confidence']) for a, b in pairs)
+    return report
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'export'
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else MODEL_DIR
+    if command == 'export':
+        print('wrote', export(model_dir))
+    elif command == 'parity':
+        mismatches = check_parity(model_dir)
+        for text, expected, actual in mismatches:
+            print('%r\n  rasa:  %s\n  numpy: %s' % (text, expected, actual))
+        print('%d mismatches' % len(mismatches))
+        sys.exit(1 if mismatches else 0)
+    elif command == 'quantize':
+        print('wrote', quantize(model_dir))
+        report = compare_quantized(model_dir)
+        for name in ('float32', 'int8'):
+            print('%-8s accuracy %.3f  weights %7d bytes  p50 %.3fms' % (
+                name, report[name]['accuracy'], report[name]['weight_bytes'], report[name]['latency_p50_ms']))
+        print('top intent agreement %.3f, max confidence delta %.4f' % (
+            report['agreement'], report['max_confidence_delta']))
+    else:
+        sys.exit('usage: python rasa_numpy.py [export|parity|quantize] [model_dir]')
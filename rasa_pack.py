@@ -0,0 +1,75 @@
+"""Flat, memory-mappable array files.
+
+A pack file is a JSON header naming each array's dtype, shape and offset,
+followed by the raw data of every array aligned to 64 bytes. Mapping it
+gives NumPy views of one read-only ``mmap``, so processes that map the
+same file share its pages. The worker pool (:mod:`rasa_pool`) and the
+compiled dataset (:mod:`rasa_dataset`) are stored this way.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b'NLUPACK1'
+ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_pack(arrays, path):
+    """Writes ``arrays`` to ``path`` as a JSON header followed by aligned raw data."""
+    header = {}
+    blobs = []
+    offset = 0
+    for name in sorted(arrays):
+        # not ascontiguousarray, which would turn 0-d arrays into 1-d ones
+        array = np.asarray(arrays[name], order='C')
+        offset = _aligned(offset)
+        header[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        blobs.append((offset, array))
+        offset += array.nbytes
+
+    encoded = json.dumps(header).encode('utf-8')
+    start = _aligned(len(MAGIC) + 4 + len(encoded))
+
+    # write next to the target and swap it in, so workers that still map
+    # the old file keep reading a consistent copy. The temporary name is
+    # unique, two processes may be writing the same pack.
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                               dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(MAGIC)
+            fp.write(struct.pack('<I', len(encoded)))
+            fp.write(encoded)
+            for position, array in blobs:
+                fp.seek(start + position)
+                fp.write(array.tobytes())
+            fp.truncate(start + offset)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def map_pack(path):
+    """Returns the arrays in a pack file as read-only views of one mmap."""
+    with open(path, 'rb') as fp:
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError('%s is not an NLU pack file' % path)
+    length, = struct.unpack_from('<I', buffer, len(MAGIC))
+    header = json.loads(buffer[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode('utf-8'))
+    start = _aligned(len(MAGIC) + 4 + length)
+
+    return {name: np.ndarray(tuple(info['shape']), dtype=np.dtype(info['dtype']),
+                             buffer=buffer, offset=start + info['offset'])
+            for name, info in header.items()}
@@ -0,0 +1,267 @@
+"""Process pool for intent classification with shared model weights.
+
+The NumPy export is repacked into one flat file (``python rasa_pool.py
+pack``) that every worker memory-maps read-only, so N workers share a
+single copy of the weights and vocabulary in the page cache instead of
+each holding their own.
+
+:class:`NLUPool` dispatches requests round-robin, pings idle workers
+from a background thread and respawns any worker that died, stopped
+answering or broke its pipe.
+"""
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+
+import numpy as np
+
+from rasa_api import MODEL_DIR, ModelStamp, read_trained_at
+from rasa_numpy import EXPORT_FILE, NumpyIntentClassifier
+from rasa_pack import map_pack, write_pack
+
+PACK_FILE = 'intent_classifier_shared.bin'
+
+
+def pack(model_dir=MODEL_DIR, path=None):
+    """Repacks the NumPy export of ``model_dir`` for memory mapping.
+
+    The vocabulary is stored sorted so workers can look tokens up with a
+    binary search on the mapped array.
+    """
+    export = os.path.join(model_dir, EXPORT_FILE)
+    if not os.path.exists(export):
+        raise ValueError('%s is missing, run "python rasa_numpy.py export" first' % EXPORT_FILE)
+    with np.load(export) as npz:
+        # checked before the weights are read, NLUPool retries this per request
+        if str(npz['trained_at']) != read_trained_at(model_dir):
+            raise ValueError('%s is stale, run "python rasa_numpy.py export" first' % EXPORT_FILE)
+        arrays = {name: npz[name] for name in npz.files}
+
+    words = arrays['vocabulary']
+    order = np.argsort(words, kind='mergesort')
+    if np.any(order != np.arange(len(words))):
+        arrays['vocabulary'] = words[order]
+        arrays['vocabulary_ids'] = order.astype(np.int32)
+
+    path = path or os.path.join(model_dir, PACK_FILE)
+    write_pack(arrays, path)
+    return path
+
+
+def ensure_pack(model_dir=MODEL_DIR):
+    """Returns the pack file of ``model_dir``, repacking it if it is from another model.
+
+    Raises ``ValueError`` like :func:`pack` when the export is missing or stale.
+    """
+    path = os.path.join(model_dir, PACK_FILE)
+    if os.path.exists(path):
+        trained_at = map_pack(path).get('trained_at')
+        if trained_at is not None and str(trained_at) == read_trained_at(model_dir):
+            return path
+    return pack(model_dir, path)
+
+
+def load_mapped(path):
+    """Returns a :class:`NumpyIntentClassifier` over a mapped pack file."""
+    return NumpyIntentClassifier(map_pack(path))
+
+
+def _serve(conn, path, inherited):
+    # with the fork start method, connections to the other workers were
+    # copied in
+    for other in inherited:
+        other.close()
+
+    engine = load_mapped(path)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+
+        kind, payload = message
+        if kind == 'ping':
+            conn.send(('pong', os.getpid()))
+            continue
+        try:
+            conn.send(('ok', engine.parse_batch(payload)))
+        except Exception as e:
+            conn.send(('error', '%s: %s' % (type(e).__name__, e)))
+
+
+class WorkerError(Exception):
+    """Raised when a worker process fails to parse a batch."""
+
+
+class _Worker:
+    def __init__(self, context, path, inherited):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, path, inherited), daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def call(self, message, timeout):
+        with self.lock:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                raise TimeoutError('worker %s did not answer within %.1fs' % (self.process.pid, timeout))
+            kind, payload = self.conn.recv()
+            self.requests += 1
+
+        if kind == 'error':
+            raise WorkerError(payload)
+        return payload
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class NLUPool:
+    """Round-robin pool of classifier processes over one mapped model file.
+
+    ``parse`` and ``parse_batch`` are thread safe. A request whose worker
+    dies or times out is retried once on a fresh worker. When the model is
+    retrained, the pool keeps serving the old pack until the NumPy export
+    catches up and can be repacked.
+    """
+
+    def __init__(self, workers=None, model_dir=MODEL_DIR, *, timeout=10.0,
+                 health_interval=5.0, start_method=None):
+        if start_method is None:
+            # workers are respawned from the health thread while the NLU
+            # threads and the event loop run, and a forked child can hang
+            # on a lock one of them held. The weights are shared either
+            # way, every worker maps the same pack file.
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+
+        self.model_dir = model_dir
+        self.timeout = timeout
+        self.size = workers or os.cpu_count() or 1
+        self._context = multiprocessing.get_context(start_method)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._counter = itertools.count()
+        self._stamp = ModelStamp(model_dir)
+        self._stamp.changed()
+        self.respawns = 0
+        self.failures = 0
+        self.stale_reloads = 0
+
+        self.path = ensure_pack(model_dir)
+        self._workers = []
+        for _ in range(self.size):
+            self._workers.append(self._spawn())
+
+        self._closed = threading.Event()
+        if health_interval:
+            self._health = threading.Thread(target=self._monitor, args=(health_interval,),
+                                            name='nlu-pool-health', daemon=True)
+            self._health.start()
+
+    def _spawn(self):
+        # only a forked child inherits the other workers' pipes
+        inherited = [w.conn for w in self._workers] if self._context.get_start_method() == 'fork' else []
+        return _Worker(self._context, self.path, inherited)
+
+    def _respawn(self, index, worker):
+        with self._lock:
+            if self._workers[index] is not worker:
+                return
+            self._workers[index] = self._spawn()
+            self.respawns += 1
+        worker.stop()
+
+    def _monitor(self, interval):
+        while not self._closed.wait(interval):
+            self.check_health()
+
+    def check_health(self):
+        """Pings idle workers and respawns any that are dead or unresponsive."""
+        for index, worker in enumerate(list(self._workers)):
+            if not worker.process.is_alive():
+                self._respawn(index, worker)
+                continue
+            if worker.lock.locked():
+                # busy with a request, which has its own timeout
+                continue
+            try:
+                worker.call(('ping', None), self.timeout)
+            except (EOFError, OSError, TimeoutError):
+                self._respawn(index, worker)
+
+    def reload(self):
+        """Repacks the model and replaces every worker.
+
+        Raises ``ValueError`` if the NumPy export is stale; the workers
+        then keep the pack they have.
+        """
+        self.path = pack(self.model_dir)
+        for index, worker in enumerate(list(self._workers)):
+            self._respawn(index, worker)
+
+    def _reload_if_retrained(self):
+        with self._reload_lock:
+            previous = self._stamp.trained_at
+            if not self._stamp.changed():
+                return
+            try:
+                self.reload()
+            except ValueError:
+                # the export has not caught up with the retrain yet, so try
+                # again on the next request
+                self._stamp.mtime, self._stamp.trained_at = None, previous
+                self.stale_reloads += 1
+
+    def parse_batch(self, texts):
+        self._reload_if_retrained()
+
+        texts = list(texts)
+        for attempt in range(2):
+            index = next(self._counter) % len(self._workers)
+            worker = self._workers[index]
+            try:
+                return worker.call(('parse', texts), self.timeout)
+            except (EOFError, OSError, TimeoutError):
+                self.failures += 1
+                self._respawn(index, worker)
+                if attempt:
+                    raise
+
+    def parse(self, text):
+        return self.parse_batch([text])[0]
+
+    def shutdown(self):
+        self._closed.set()
+        for worker in self._workers:
+            worker.stop()
+
+    def stats(self):
+        return {
+            'workers': [{'pid': w.process.pid, 'alive': w.process.is_alive(), 'requests': w.requests}
+                        for w in self._workers],
+            'respawns': self.respawns,
+            'failures': self.failures,
+            'stale_reloads': self.stale_reloads,
+        }
+
+
+if __name__ == '__main__':
+    model_dir = sys.argv[2] if len(sys.argv) > 2 else MODEL_DIR
+    if sys.argv[1:2] == ['pack']:
+        print('wrote', pack(model_dir))
+    else:
+        sys.exit('usage: python rasa_pool.py pack [model_dir]')
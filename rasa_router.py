@@ -0,0 +1,209 @@
+"""Confidence-based routing between a cheap and an expensive intent model.
+
+The first tier is :class:`CentroidIntentModel`, a TF-IDF nearest-centroid
+model that is built straight from the training examples in a few
+milliseconds and answers in microseconds. Its answer is only trusted when
+its confidence clears the threshold for the predicted intent. Otherwise
+the message is escalated to the embedding classifier.
+
+Per-intent thresholds come from k-fold cross-validation of the centroid
+model over ``dataset.json``. ``python rasa_router.py calibrate`` writes
+them to ``rasa_nlu_api/thresholds.json``.
+"""
+import collections
+import json
+import math
+import os
+import sys
+
+from rasa_api import DATASET, load_examples, normalize, stratified_folds, INTENT_RANKING_LENGTH
+
+THRESHOLDS = 'rasa_nlu_api/thresholds.json'
+
+# a threshold no confidence can reach, i.e. always escalate
+NEVER = 1.01
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    if not norm:
+        return {}
+    return {k: v / norm for k, v in vector.items()}
+
+
+class CentroidIntentModel:
+    """Cosine similarity between a message and per-intent TF-IDF centroids."""
+
+    def __init__(self, examples):
+        documents = [(collections.Counter(normalize(text)), intent) for text, intent in examples]
+        df = collections.Counter()
+        for counts, _ in documents:
+            df.update(counts.keys())
+
+        n = len(documents)
+        self.idf = {token: math.log((1.0 + n) / (1.0 + count)) + 1.0 for token, count in df.items()}
+
+        sums = collections.defaultdict(collections.Counter)
+        for counts, intent in documents:
+            for token, value in self._weigh(counts).items():
+                sums[intent][token] += value
+        self.centroids = {intent: _unit(vector) for intent, vector in sums.items()}
+
+    def _weigh(self, counts):
+        idf = self.idf
+        return _unit({token: count * idf[token] for token, count in counts.items() if token in idf})
+
+    def parse(self, text):
+        vector = self._weigh(collections.Counter(normalize(text)))
+        scores = [(sum(weight * centroid.get(token, 0.0) for token, weight in vector.items()), intent)
+                  for intent, centroid in self.centroids.items()]
+        scores.sort(reverse=True)
+        ranking = [{'name': intent, 'confidence': score} for score, intent in scores[:INTENT_RANKING_LENGTH]]
+        return {'intent': ranking[0], 'entities': [], 'intent_ranking': ranking, 'text': text}
+
+
+def cross_validate(examples, k=5, seed=0, model=CentroidIntentModel):
+    """Returns ``(predicted, confidence, correct)`` for every held-out example.
+
+    Folds are stratified so every intent shows up in every training split
+    it can.
+    """
+    folds = stratified_folds(examples, k, seed)
+
+    predictions = []
+    for index, held_out in enumerate(folds):
+        if not held_out:
+            continue
+        train = [e for i, fold in enumerate(folds) if i != index for e in fold]
+        fitted = model(train)
+        for text, intent in held_out:
+            predicted = fitted.parse(text)['intent']
+            predictions.append((predicted['name'], predicted['confidence'], predicted['name'] == intent))
+    return predictions
+
+
+def calibrate(examples, k=5, precision=0.95, seed=0):
+    """Returns the lowest confidence per intent that keeps ``precision``.
+
+    Intents whose held-out predictions never reach the target precision
+    get :data:`NEVER`, so the router always escalates them.
+    """
+    by_intent = collections.defaultdict(list)
+    for predicted, confidence, correct in cross_validate(examples, k=k, seed=seed):
+        by_intent[predicted].append((confidence, correct))
+
+    thresholds = {intent: NEVER for _, intent in examples}
+    for intent, scored in by_intent.items():
+        scored.sort(reverse=True)
+        right = total = 0
+        for confidence, correct in scored:
+            total += 1
+            right += correct
+            if right / total >= precision and confidence > 0.0:
+                thresholds[intent] = confidence
+    return thresholds
+
+
+def save_thresholds(thresholds, path=THRESHOLDS):
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump(thresholds, fp, indent=4, sort_keys=True)
+
+
+def load_thresholds(path=THRESHOLDS):
+    with open(path, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+class Tier:
+    """One model in the routing chain.
+
+    ``thresholds`` maps intent names to the minimum confidence this tier
+    may answer with. The last tier should have no thresholds; it always
+    answers.
+    """
+
+    def __init__(self, name, parse, parse_batch=None, thresholds=None, default_threshold=NEVER):
+        self.name = name
+        self.parse = parse
+        self.parse_batch = parse_batch or (lambda texts: [parse(text) for text in texts])
+        self.thresholds = thresholds
+        self.default_threshold = default_threshold
+
+    def accepts(self, result):
+        if self.thresholds is None:
+            return True
+        intent = result['intent']
+        return intent['confidence'] >= self.thresholds.get(intent['name'], self.default_threshold)
+
+
+class ModelRouter:
+    """Runs each message through ``tiers`` until one is confident enough."""
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.answered = collections.Counter()
+        self.escalated = collections.Counter()
+
+    @classmethod
+    def from_dataset(cls, heavy_parse, heavy_parse_batch=None, dataset=DATASET, thresholds=THRESHOLDS):
+        """Builds the centroid tier from ``dataset`` in front of ``heavy_parse``.
+
+        Thresholds are read from ``thresholds`` when that file exists and
+        calibrated on the spot otherwise.
+        """
+        examples = load_examples(dataset)
+        if thresholds and os.path.exists(thresholds):
+            values = load_thresholds(thresholds)
+        else:
+            values = calibrate(examples)
+
+        return cls([
+            Tier('centroid', CentroidIntentModel(examples).parse, thresholds=values),
+            Tier('model', heavy_parse, heavy_parse_batch),
+        ])
+
+    def parse(self, text):
+        for tier in self.tiers:
+            result = tier.parse(text)
+            if tier.accepts(result):
+                self.answered[tier.name] += 1
+                return result
+            self.escalated[tier.name] += 1
+        return result
+
+    def parse_batch(self, texts):
+        results = [None] * len(texts)
+        pending = list(range(len(texts)))
+        for tier in self.tiers:
+            if not pending:
+                break
+            parsed = tier.parse_batch([texts[i] for i in pending])
+            remaining = []
+            for i, result in zip(pending, parsed):
+                results[i] = result
+                if tier.accepts(result):
+                    self.answered[tier.name] += 1
+                else:
+                    self.escalated[tier.name] += 1
+                    remaining.append(i)
+            pending = remaining
+        return results
+
+    def stats(self):
+        return {'answered': dict(self.answered), 'escalated': dict(self.escalated)}
+
+
+if __name__ == '__main__':
+    examples = load_examples(DATASET)
+    thresholds = calibrate(examples)
+    if sys.argv[1:2] == ['calibrate']:
+        save_thresholds(thresholds)
+        print('wrote', THRESHOLDS)
+    predictions = cross_validate(examples)
+    accuracy = sum(correct for _, _, correct in predictions) / len(predictions)
+    trusted = [p for p in predictions if p[1] >= thresholds.get(p[0], NEVER)]
+    print('centroid cross-validation accuracy: %.3f' % accuracy)
+    print('answered without escalation: %d/%d (%d wrong)' % (
+        len(trusted), len(predictions), sum(not correct for _, _, correct in trusted)))
+    for intent, value in sorted(thresholds.items()):
+        print('  %-20s %.3f' % (intent, value))
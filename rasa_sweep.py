@@ -0,0 +1,209 @@
+"""Cross-validated hyperparameter sweep for the embedding intent classifier.
+
+Every combination in the grid is trained and evaluated on the same
+stratified k-fold splits of ``dataset.json``, with one process pool job
+per (config, fold). The count-vector features of each fold only depend
+on the featurizer, so they are computed once, cached on disk under
+``rasa_nlu_api/.sweep_cache`` and reused by every config and later runs.
+
+The results table has accuracy, training time and per-message inference
+latency for each config. With ``--min-accuracy`` the fastest config that
+reaches it is printed as the pick::
+
+    $ python rasa_sweep.py --grid grid.json --min-accuracy 0.9 --out sweep.csv
+"""
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import statistics
+import time
+
+from rasa_api import CONFIG, DATASET, load_examples, percentile, stratified_folds
+
+CACHE_DIR = 'rasa_nlu_api/.sweep_cache'
+FEATURIZER = 'intent_featurizer_count_vectors'
+CLASSIFIER = 'intent_classifier_tensorflow_embedding'
+
+DEFAULT_GRID = {
+    'hidden_layer_size_a': [[256, 128], [128, 64], [64]],
+    'embed_dim': [10, 20],
+    'num_neg': [10, 20],
+    'epochs': [100, 300],
+    'batch_size': [[64, 256]],
+}
+
+
+def expand_grid(grid):
+    """Yields one classifier config per combination of the values in ``grid``."""
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[key] for key in keys)):
+        config = dict(zip(keys, values))
+        if 'hidden_layer_size_a' in config:
+            config['num_hidden_layers_a'] = len(config['hidden_layer_size_a'])
+        if 'hidden_layer_size_b' in config:
+            config['num_hidden_layers_b'] = len(config['hidden_layer_size_b'])
+        yield config
+
+
+def _pipeline_config(name):
+    from rasa_nlu import config
+
+    return config.load(CONFIG).for_component(name)
+
+
+def _featurize_fold(train, test, featurizer_config):
+    from rasa_nlu.featurizers.count_vectors_featurizer import CountVectorsFeaturizer
+    from rasa_nlu.training_data import Message, TrainingData
+
+    data = TrainingData([Message(text, {'intent': intent}) for text, intent in train])
+    featurizer = CountVectorsFeaturizer(featurizer_config)
+    featurizer.train(data)
+
+    held_out = []
+    for text, intent in test:
+        message = Message(text)
+        featurizer.process(message)
+        held_out.append((text, intent, message.get('text_features')))
+
+    return {
+        'train': [(e.text, e.get('intent'), e.get('text_features')) for e in data.intent_examples],
+        'test': held_out,
+    }
+
+
+def cached_folds(dataset=DATASET, k=5, seed=0, cache_dir=CACHE_DIR):
+    """Returns the paths of the featurized folds, computing the missing ones."""
+    featurizer_config = _pipeline_config(FEATURIZER)
+    with open(dataset, 'rb') as fp:
+        digest = hashlib.sha1(fp.read())
+    digest.update(json.dumps([k, seed, featurizer_config], sort_keys=True).encode('utf-8'))
+    key = digest.hexdigest()[:16]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    folds = stratified_folds(load_examples(dataset), k, seed)
+    paths = []
+    for index, test in enumerate(folds):
+        path = os.path.join(cache_dir, '%s-fold%d.pkl' % (key, index))
+        if not os.path.exists(path):
+            train = [e for i, fold in enumerate(folds) if i != index for e in fold]
+            with open(path + '.tmp', 'wb') as fp:
+                pickle.dump(_featurize_fold(train, test, featurizer_config), fp)
+            os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def run_job(fold_path, overrides):
+    """Trains one config on one cached fold and evaluates it on the held-out part."""
+    from rasa_nlu.classifiers.embedding_intent_classifier import EmbeddingIntentClassifier
+    from rasa_nlu.training_data import Message, TrainingData
+
+    with open(fold_path, 'rb') as fp:
+        fold = pickle.load(fp)
+
+    data = TrainingData([Message(text, {'intent': intent, 'text_features': features})
+                         for text, intent, features in fold['train']])
+    config = dict(_pipeline_config(CLASSIFIER), **overrides)
+    classifier = EmbeddingIntentClassifier(config)
+
+    start = time.perf_counter()
+    classifier.train(data)
+    train_time = time.perf_counter() - start
+
+    correct = 0
+    latencies = []
+    for text, intent, features in fold['test']:
+        message = Message(text, {'text_features': features})
+        start = time.perf_counter()
+        classifier.process(message)
+        latencies.append(time.perf_counter() - start)
+        correct += message.get('intent')['name'] == intent
+
+    return {
+        'accuracy': correct / len(fold['test']),
+        'train_time': train_time,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+    }
+
+
+def sweep(grid=DEFAULT_GRID, dataset=DATASET, k=5, seed=0, workers=None):
+    """Runs every config of ``grid`` on every fold and returns one row per config."""
+    folds = cached_folds(dataset, k, seed)
+    configs = list(expand_grid(grid))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(run_job, path, config): index
+                for index, config in enumerate(configs) for path in folds}
+        results = [[] for _ in configs]
+        for future in concurrent.futures.as_completed(jobs):
+            results[jobs[future]].append(future.result())
+
+    rows = []
+    for config, runs in zip(configs, results):
+        accuracies = [r['accuracy'] for r in runs]
+        rows.append({
+            'config': {key: value for key, value in config.items() if key in grid},
+            'accuracy': statistics.mean(accuracies),
+            'accuracy_std': statistics.pstdev(accuracies),
+            'train_time': statistics.mean(r['train_time'] for r in runs),
+            'latency_p50_ms': 1000 * statistics.mean(r['latency_p50'] for r in runs),
+            'latency_p95_ms': 1000 * statistics.mean(r['latency_p95'] for r in runs),
+        })
+    return rows
+
+
+def fastest(rows, min_accuracy):
+    """Returns the lowest-latency row with at least ``min_accuracy``, or ``None``."""
+    eligible = [row for row in rows if row['accuracy'] >= min_accuracy]
+    return min(eligible, key=lambda row: row['latency_p50_ms']) if eligible else None
+
+
+def write_csv(rows, path):
+    fields = ['config', 'accuracy', 'accuracy_std', 'train_time', 'latency_p50_ms', 'latency_p95_ms']
+    with open(path, 'w', newline='', encoding='utf-8') as fp:
+        writer = csv.DictWriter(fp, fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, config=json.dumps(row['config'], sort_keys=True)))
+
+
+def print_table(rows):
+    print('%-70s %8s %8s %10s %10s' % ('config', 'acc', 'std', 'train s', 'p50 ms'))
+    for row in sorted(rows, key=lambda row: (-row['accuracy'], row['latency_p50_ms'])):
+        print('%-70s %8.3f %8.3f %10.1f %10.3f' % (
+            json.dumps(row['config'], sort_keys=True), row['accuracy'], row['accuracy_std'],
+            row['train_time'], row['latency_p50_ms']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--grid', help='JSON file mapping parameter names to lists of values')
+    parser.add_argument('--dataset', default=DATASET)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--min-accuracy', type=float)
+    parser.add_argument('--out', help='write the table as CSV to this path')
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, encoding='utf-8') as fp:
+            grid = json.load(fp)
+
+    rows = sweep(grid, args.dataset, args.folds, args.seed, args.workers)
+    print_table(rows)
+    if args.out:
+        write_csv(rows, args.out)
+    if args.min_accuracy is not None:
+        pick = fastest(rows, args.min_accuracy)
+        if pick is None:
+            print('no config reaches %.3f accuracy' % args.min_accuracy)
+        else:
+            print('fastest config with accuracy >= %.3f: %s' % (args.min_accuracy, json.dumps(pick['config'])))
@@ -0,0 +1,260 @@
+"""Incremental retraining of the intent model.
+
+A full ``rasa_api.call()`` refits the vocabulary and trains the embedding
+classifier from scratch for 300 epochs. :func:`retrain` instead starts
+from the current model:
+
+* the count-vectorizer keeps its vocabulary, and tokens that only appear
+  in new examples are appended with new feature ids;
+* the classifier graph is initialised from the current checkpoint, with
+  rows of the input and intent layers remapped by token and intent name;
+* training only runs over the new or changed examples plus a random
+  replay sample of the old ones, which keeps the model from forgetting
+  them, for a fraction of the epochs.
+
+Examples deleted from the dataset are not in the retrained model's
+training data, and a run with only deletions still trains on a replay
+sample so the weights move away from them.
+
+The result is persisted next to the live model as ``model.<trained_at>``
+and swapped in by pointing the ``model`` symlink at it with a single
+``os.replace``, so there is always a complete model at ``model``. The
+first swap turns a plain ``model`` directory into such a version (or run
+``python rasa_train.py link`` once while the bot is stopped). When
+retraining runs inside the bot process, the new model is preloaded
+before :func:`retrain` returns. A full ``rasa_api.call()`` installs its
+model the same way.
+"""
+import os
+import pickle
+import random
+import shutil
+import sys
+
+import numpy as np
+
+import rasa_api
+import rasa_dataset
+from rasa_api import MODEL_DIR, DATASET, CONFIG
+
+INV_INTENT_DICT = 'intent_classifier_tensorflow_embedding_inv_intent_dict.pkl'
+CHECKPOINT = 'intent_classifier_tensorflow_embedding.ckpt'
+
+
+def _example_set(training_data):
+    return {(e.text, e.get('intent')) for e in training_data.intent_examples}
+
+
+def _extend_vocabulary(vect, texts):
+    """Adds unseen tokens of ``texts`` to ``vect`` after the existing ids."""
+    analyze = vect.build_analyzer()
+    vocabulary = vect.vocabulary_
+    unseen = sorted({token for text in texts for token in analyze(text)} - set(vocabulary))
+    for token in unseen:
+        vocabulary[token] = len(vocabulary)
+    return unseen
+
+
+def _warm_train_tf(classifier, reader, old_vocabulary, new_vocabulary, old_intents, rows):
+    """Returns a replacement for ``EmbeddingIntentClassifier._train_tf``.
+
+    It is installed on the instance, so ``train`` still builds the graph
+    as usual and then hands over to this instead of training from random
+    weights.
+    """
+    import tensorflow as tf
+
+    def train_tf(X, Y, intents_for_X, loss, is_training, train_op):
+        session = classifier.session
+        session.run(tf.global_variables_initializer())
+
+        row_maps = {
+            'hidden_layer_a_0/kernel' if classifier.num_hidden_layers_a else 'embed_layer_a/kernel':
+                [(old, new_vocabulary[token]) for token, old in old_vocabulary.items()],
+        }
+        if not classifier.intent_tokenization_flag:
+            new_intents = {name: i for i, name in classifier.inv_intent_dict.items()}
+            row_maps['hidden_layer_b_0/kernel' if classifier.num_hidden_layers_b else 'embed_layer_b/kernel'] = [
+                (i, new_intents[name]) for i, name in old_intents.items() if name in new_intents]
+
+        for var in tf.trainable_variables():
+            name = var.op.name
+            if not reader.has_tensor(name):
+                continue
+            old = reader.get_tensor(name)
+            value = session.run(var)
+            if name in row_maps:
+                for old_row, new_row in row_maps[name]:
+                    value[new_row] = old[old_row]
+            elif old.shape == value.shape:
+                value = old
+            else:
+                continue
+            var.load(value, session)
+
+        X, Y, intents_for_X = X[rows], Y[rows], intents_for_X[rows]
+        for ep in range(classifier.epochs):
+            indices = np.random.permutation(len(X))
+            batch_size = classifier._linearly_increasing_batch_size(ep)
+            for start in range(0, len(X), batch_size):
+                batch = indices[start:start + batch_size]
+                batch_b = classifier._create_batch_b(Y[batch], intents_for_X[batch])
+                session.run(train_op, feed_dict={classifier.a_in: X[batch],
+                                                  classifier.b_in: batch_b,
+                                                  is_training: True})
+
+    return train_tf
+
+
+def _version_dir(model_dir, source):
+    """Returns an unused ``<model_dir>.<trained_at>`` path for the model in ``source``."""
+    base = '%s.%s' % (os.path.normpath(model_dir), rasa_api.read_trained_at(source))
+    path, n = base, 1
+    while os.path.lexists(path):
+        n += 1
+        path = '%s-%d' % (base, n)
+    return path
+
+
+def _point(model_dir, version):
+    """Atomically points the ``model_dir`` symlink at ``version``."""
+    tmp = os.path.normpath(model_dir) + '.link'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(os.path.basename(version), tmp)
+    os.replace(tmp, model_dir)
+
+
+def link_model(model_dir=MODEL_DIR):
+    """Turns a plain ``model_dir`` directory into a symlink to a versioned copy.
+
+    This is the only step with a moment where ``model_dir`` does not
+    exist, so it is done once, ideally while the bot is stopped.
+    """
+    model_dir = os.path.normpath(model_dir)
+    if os.path.islink(model_dir):
+        return os.path.realpath(model_dir)
+    if not os.path.exists(model_dir):
+        # nothing trained yet
+        return None
+    version = _version_dir(model_dir, model_dir)
+    os.rename(model_dir, version)
+    _point(model_dir, version)
+    return version
+
+
+def swap_model(new_dir, model_dir=MODEL_DIR, keep=1):
+    """Makes ``new_dir`` the live model and returns the version it replaced, if any.
+
+    ``new_dir`` is renamed to ``<model_dir>.<trained_at>`` and the
+    ``model_dir`` symlink is switched to it with one ``os.replace``.
+    ``keep`` older versions are kept next to it for rolling back.
+    """
+    model_dir = os.path.normpath(model_dir)
+    previous = link_model(model_dir)
+    version = _version_dir(model_dir, new_dir)
+    os.rename(new_dir, version)
+    _point(model_dir, version)
+
+    project_dir, model_name = os.path.split(model_dir)
+    prefix = model_name + '.'
+    # trained_at stamps sort by time
+    older = sorted(os.path.join(project_dir, name) for name in os.listdir(project_dir)
+                   if name.startswith(prefix) and name[len(prefix):len(prefix) + 1].isdigit())
+    older.remove(version)
+    for old in older[:max(len(older) - keep, 0)]:
+        shutil.rmtree(old)
+    return previous
+
+
+def retrain(dataset=DATASET, model_dir=MODEL_DIR, *, epochs=50, replay=2.0, seed=None, swap=True):
+    """Warm-starts the model in ``model_dir`` on the changes in ``dataset``.
+
+    ``replay`` is how many old examples to mix in per new, changed or
+    deleted one. Returns the directory of the new model, or ``None`` when
+    the dataset has no new, changed or deleted examples.
+    """
+    import tensorflow as tf
+    from rasa_nlu import config
+    from rasa_nlu.model import Interpreter, Trainer
+    from rasa_nlu.training_data import load_data
+
+    training_data = rasa_dataset.load(dataset).training_data()
+    old_data = load_data(os.path.join(model_dir, 'training_data.json'))
+    changed = _example_set(training_data) - _example_set(old_data)
+    removed = _example_set(old_data) - _example_set(training_data)
+    if not changed and not removed:
+        return None
+
+    # a private copy; the bot may be using the cached components
+    interpreter = Interpreter.load(model_dir)
+    components = {c.name: c for c in interpreter.pipeline}
+    featurizer = components['intent_featurizer_count_vectors']
+    classifier = components['intent_classifier_tensorflow_embedding']
+
+    old_vocabulary = dict(featurizer.vect.vocabulary_)
+    _extend_vocabulary(featurizer.vect, [text for text, _ in changed])
+    for example in training_data.training_examples:
+        featurizer.process(example)
+
+    rng = random.Random(seed)
+    examples = training_data.intent_examples
+    new_rows = [i for i, e in enumerate(examples) if (e.text, e.get('intent')) in changed]
+    old_rows = [i for i, e in enumerate(examples) if (e.text, e.get('intent')) not in changed]
+    # deleted examples are already out of training_data; they count
+    # towards the replay sample so a deletion-only run still trains
+    replayed = rng.sample(old_rows, min(len(old_rows), int(round((len(new_rows) + len(removed)) * replay))))
+
+    with open(os.path.join(model_dir, INV_INTENT_DICT), 'rb') as fp:
+        old_intents = pickle.load(fp)
+    reader = tf.train.NewCheckpointReader(os.path.join(model_dir, CHECKPOINT))
+
+    classifier.epochs = epochs
+    classifier._train_tf = _warm_train_tf(classifier, reader, old_vocabulary, featurizer.vect.vocabulary_,
+                                          old_intents, np.array(sorted(new_rows + replayed)))
+    cfg = config.load(CONFIG)
+    classifier.train(training_data, cfg)
+
+    # persist through a Trainer so metadata.json is written the usual way
+    trainer = Trainer(cfg)
+    trainer.pipeline = [featurizer, classifier]
+    trainer.training_data = training_data
+    return install(trainer, model_dir, swap=swap)
+
+
+def install(trainer, model_dir=MODEL_DIR, *, swap=True):
+    """Persists ``trainer``'s model next to ``model_dir`` and swaps it in.
+
+    The model is written to ``<model_dir>.incoming``, given the NumPy
+    exports the live model has, and handed to :func:`swap_model`. A
+    loaded model is replaced by preloading the new one. Returns
+    ``model_dir``, or the incoming directory when ``swap`` is false.
+    """
+    project_dir, model_name = os.path.split(os.path.normpath(model_dir))
+    incoming = os.path.join(project_dir, model_name + '.incoming')
+    if os.path.exists(incoming):
+        shutil.rmtree(incoming)
+    new_dir = trainer.persist(os.path.dirname(project_dir), project_name=os.path.basename(project_dir),
+                              fixed_model_name=model_name + '.incoming')
+
+    import rasa_numpy
+    if os.path.exists(os.path.join(model_dir, rasa_numpy.EXPORT_FILE)):
+        rasa_numpy.export(new_dir)
+        if os.path.exists(os.path.join(model_dir, rasa_numpy.QUANTIZED_FILE)):
+            rasa_numpy.quantize(new_dir)
+
+    if not swap:
+        return new_dir
+
+    swap_model(new_dir, model_dir)
+    if rasa_api.registry.trained_at(model_dir) is not None:
+        rasa_api.registry.preload(model_dir)
+    return model_dir
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['link']:
+        print('linked', link_model(*sys.argv[2:3]))
+        sys.exit()
+    result = retrain(*sys.argv[1:3])
+    print('nothing changed' if result is None else 'updated %s' % result)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the bundled library, without installing it, and the bot's modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'discord api'))
+sys.path.insert(0, ROOT)
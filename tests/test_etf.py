@@ -0,0 +1,89 @@
+"""Round trips of recorded gateway frames through ``discord.etf``.
+
+``gateway_frames.jsonl`` holds one JSON frame per line, recorded from
+``discord_load.GatewayFeed``. Each is converted the way the gateway
+sends it with ``encoding=etf``, snowflakes as integers, by the same
+``discord_bench.etf_term`` the benchmark uses.
+"""
+import json
+import os
+import struct
+import zlib
+
+import pytest
+
+import discord
+from discord import etf
+from discord.state import ConnectionState
+
+from discord_bench import etf_term
+
+FRAMES = os.path.join(os.path.dirname(__file__), 'gateway_frames.jsonl')
+
+
+def _json_term(value):
+    if isinstance(value, dict):
+        return {key: _json_term(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_json_term(item) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 10 ** 14:
+        return str(value)
+    return value
+
+
+def _frames():
+    with open(FRAMES, encoding='utf-8') as fp:
+        return [json.loads(line) for line in fp if line.strip()]
+
+
+@pytest.mark.parametrize('frame', _frames(), ids=lambda frame: str(frame['t'] or frame['op']))
+def test_frame_round_trip(frame):
+    term = etf_term(frame)
+    decoded = etf.loads(etf.dumps(term))
+    assert decoded == term
+    assert _json_term(decoded) == frame
+
+
+def test_snowflakes_decode_as_int():
+    frame = next(frame for frame in _frames() if frame['t'] == 'MESSAGE_CREATE')
+    decoded = etf.loads(etf.dumps(etf_term(frame)))
+    assert decoded['d']['id'] == int(frame['d']['id'])
+    assert decoded['d']['content'] == frame['d']['content']
+
+
+@pytest.mark.parametrize('value', [
+    0, 255, 256, -1, 2 ** 31 - 1, -2 ** 31, 2 ** 31, -2 ** 63, 2 ** 64 + 1, 2 ** 2100,
+    0.5, -1e300, '', 'snowman ☃', [], [[]], {}, {'a': {'b': [None, True, False]}},
+])
+def test_value_round_trip(value):
+    assert etf.loads(etf.dumps(value)) == value
+
+
+def test_compressed_term():
+    raw = etf.dumps({'op': 0, 'd': list(range(100))})[1:]
+    payload = bytes((etf.FORMAT_VERSION, etf.COMPRESSED)) + struct.pack('>I', len(raw)) + zlib.compress(raw)
+    assert etf.loads(payload) == {'op': 0, 'd': list(range(100))}
+
+
+def test_codec_sends_bytes():
+    assert isinstance(etf.codec.dumps({'op': 1, 'd': None}), bytes)
+
+
+@pytest.mark.parametrize('payload', [
+    b'',
+    b'{"op": 1}',
+    etf.dumps({'op': 0, 'd': 'payload'})[:-3],
+    etf.dumps({'op': 0}) + b'\x00',
+    b'\x83m\x00\x00\x00\x02\xff\xfe',
+    b'\x83\xff',
+    b'\x83' + b'l\x00\x00\x00\x01' * 100000 + b'j' * 100001,
+], ids=['empty', 'json', 'truncated', 'trailing', 'utf8', 'tag', 'nested'])
+def test_bad_payload(payload):
+    with pytest.raises(etf.ETFDecodeError):
+        etf.loads(payload)
+
+
+def test_unknown_gateway_encoding():
+    with pytest.raises(discord.InvalidArgument):
+        ConnectionState(dispatch=None, chunker=None, handlers={}, syncer=None, http=None, loop=None,
+                        gateway_encoding='xml')
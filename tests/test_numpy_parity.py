@@ -0,0 +1,28 @@
+"""Parity of ``rasa_numpy.NumpyIntentClassifier`` with the Rasa interpreter.
+
+Runs ``rasa_numpy.check_parity`` over ``dataset.json``. It needs
+rasa_nlu and TensorFlow for the interpreter, and a NumPy export of the
+model (``python rasa_numpy.py export``).
+"""
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import rasa_api  # noqa: E402
+import rasa_numpy  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIR = os.path.join(ROOT, rasa_api.MODEL_DIR)
+DATASET = os.path.join(ROOT, rasa_api.DATASET)
+
+
+def test_numpy_engine_matches_interpreter():
+    pytest.importorskip('rasa_nlu')
+    pytest.importorskip('tensorflow')
+    if not os.path.exists(os.path.join(MODEL_DIR, rasa_numpy.EXPORT_FILE)):
+        pytest.skip('no NumPy export, run "python rasa_numpy.py export"')
+
+    mismatches = rasa_numpy.check_parity(MODEL_DIR, DATASET)
+    assert not mismatches, '\n'.join('%r\n  rasa:  %s\n  numpy: %s' % m for m in mismatches)
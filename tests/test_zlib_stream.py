@@ -0,0 +1,69 @@
+"""``discord.gateway.ZlibStreamAssembler`` over a split zlib-stream.
+
+The frames are compressed the way the gateway does it, one shared
+stream with a sync flush after each frame, and every frame is sent as
+one or more websocket messages cut at random byte boundaries. The
+first and last frames arrive whole.
+"""
+import json
+import random
+import zlib
+
+import pytest
+
+from discord.gateway import FrameCounters, ZlibStreamAssembler, ZLIB_SUFFIX
+
+
+def _frames(rng):
+    frames = [json.dumps({'op': 11, 'd': None}).encode('utf-8')]
+    for size in (10, 1000, 50000):
+        members = [{'user': {'id': str(rng.getrandbits(63)), 'username': 'user%d' % i}}
+                   for i in range(size)]
+        frames.append(json.dumps({'op': 0, 't': 'GUILD_MEMBERS_CHUNK', 'd': {'members': members}}).encode('utf-8'))
+    # incompressible, so the compressed frame is bigger than the buffer
+    frames.append(bytes(rng.getrandbits(8) for _ in range(200000)))
+    frames.append(b'{"op": 1, "d": 2}')
+    return frames
+
+
+def _messages(frames, rng):
+    """Yields ``(frame, messages)`` with each compressed frame cut into messages."""
+    compress = zlib.compressobj()
+    for index, frame in enumerate(frames):
+        data = compress.compress(frame) + compress.flush(zlib.Z_SYNC_FLUSH)
+        assert data.endswith(ZLIB_SUFFIX)
+        if 0 < index < len(frames) - 1:
+            cuts = sorted(rng.sample(range(1, len(data)), min(len(data) - 1, rng.randint(1, 20))))
+        else:
+            cuts = []
+        bounds = [0] + cuts + [len(data)]
+        yield frame, [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('size', [16, 64 * 1024])
+def test_split_frames(size):
+    rng = random.Random(size)
+    frames = _frames(rng)
+    counters = FrameCounters()
+    assembler = ZlibStreamAssembler(size, counters)
+
+    messages = bytes_in = buffered = 0
+    for frame, chunks in _messages(frames, rng):
+        for chunk in chunks[:-1]:
+            assert assembler.feed(chunk) is None
+        assert assembler.feed(chunks[-1]) == frame
+        messages += len(chunks)
+        bytes_in += sum(map(len, chunks))
+        buffered += len(chunks) > 1
+
+    # the incompressible frame did not fit, and the buffer is kept
+    assert len(assembler._buffer) > 64 * 1024
+    assert counters.to_dict() == {
+        'messages': messages,
+        'frames': len(frames),
+        'buffered_frames': buffered,
+        'bytes_in': bytes_in,
+        'bytes_decompressed': sum(map(len, frames)),
+        'ratio': sum(map(len, frames)) / bytes_in,
+    }
+